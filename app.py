@@ -1,7 +1,19 @@
 import streamlit as st
 from datetime import date, timedelta
-from functions import send_leave_request, view_leaves, approve_leave, reject_leave, status_badge, check_admin_login, get_collections, load_collection, save_dataframe, to_excel
-from settings import EMPLOYEES_COL, LEAVES_COL
+from functions import send_leave_request, poll_pending_submissions, approve_leave, reject_leave, decide_leaves, status_badge, check_admin_login, get_collections, collection_metadata, load_collection, save_dataframe, export_collection_excel
+from settings import INTERNAL_COLLECTIONS
+from roster import get_roster
+from leave_feed import LeaveFeed
+from leave_intervals import get_interval_index, MAX_CONCURRENT_ABSENCES
+from workdays import end_date_for, working_days, audit_leave_durations, years_without_holidays
+from submission_queue import make_idempotency_key
+from rate_limit import get_submit_limiter, get_login_limiter
+from importer import import_file, import_key_columns
+from indexes import bootstrap_indexes
+from instrumentation import start_run, perf_block, render_perf_panel
+from versioning import get_data_version
+from leave_dates import format_date, DATETIME_FORMAT
+from dashboard_data import load_leave_dashboard, load_absence_calendar, DASHBOARD_BACKENDS, CALENDAR_STATUSES, CALENDAR_MAX_DAYS
 from datetime import datetime
 
 # ===============================
@@ -14,6 +26,13 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Bắt đầu đo thời gian cho lần rerun này
+start_run()
+
+# Tạo index + bảng ngày lễ một lần cho mỗi process, ở luồng nền → không chặn lần render đầu
+# (một số tab st.stop() giữa chừng nên không đặt ở cuối script)
+bootstrap_indexes()
+
 st.markdown(
     """
     <style>
@@ -68,6 +87,23 @@ with st.sidebar:
             st.session_state.clear()
             st.rerun()
 
+        roster_stats = get_roster().stats()
+        st.caption(
+            f"👥 Cache nhân viên: {roster_stats['hits']} hit · {roster_stats['misses']} miss")
+        submit_limits, login_limits = get_submit_limiter().stats(), get_login_limiter().stats()
+        st.caption(
+            f"🚦 Bị chặn: gửi yêu cầu {sum(submit_limits['rejected'].values())} · "
+            f"đăng nhập {sum(login_limits['rejected'].values())}")
+        from mongo_client import pool_stats  # chỉ HR cần, không import lúc khởi động
+        for pool_name, stats in pool_stats().items():
+            st.caption(
+                f"🔌 Pool {pool_name}: {stats['open']} mở · {stats['in_use']} đang dùng · "
+                f"{stats['checkouts']} lượt mượn · {stats['checkout_failed']} lỗi")
+        perf_panel = st.empty()  # điền ở cuối script, khi đã đo xong
+
+
+SHEET_DEFAULT_COLUMNS = 12  # số cột hiển thị mặc định ở tab Sheets
+HR_REFRESH_SECONDS = 15  # chu kỳ tự cập nhật danh sách yêu cầu ở tab HR
 
 tabs = ["📝 Yêu cầu"]
 if "hr_logged_in" in st.session_state and st.session_state.hr_logged_in:
@@ -80,26 +116,18 @@ tab_objects = st.tabs(tabs)
 # ===============================
 # TAB 1: FORM XIN NGHỈ
 # ===============================
-with tab_objects[0]:
-
-    # --- Khởi tạo biến session để lưu thời điểm bấm nút ---
-    if "last_submit_time" not in st.session_state:
-        st.session_state["last_submit_time"] = None
-
-    cooldown_seconds = 60  # Thời gian chờ giữa các lần gửi
+with tab_objects[0], perf_block("Tab yêu cầu"):
 
     tab_objects[0].subheader("📝 Gửi yêu cầu nghỉ")
 
     # --- Các phần nhập liệu như trước ---
     # Lấy danh sách nhân viên
-    employees = list(EMPLOYEES_COL.find(
-        {}, {"_id": 0, "full_name": 1, "department": 1, "position": 1, "remaining_days": 1}))
-    employee_names = [emp["full_name"] for emp in employees]
+    roster = get_roster()
+    employee_names = [emp["full_name"] for emp in roster.all()]
 
     selected_name = st.selectbox("👤 Chọn tên của bạn", employee_names)
 
-    selected_emp = next(
-        (e for e in employees if e["full_name"] == selected_name), None)
+    selected_emp = roster.get(selected_name)
     department = selected_emp.get("department", "") if selected_emp else ""
     position = selected_emp.get("position", "") if selected_emp else ""
     remaining_days = selected_emp.get(
@@ -140,42 +168,62 @@ with tab_objects[0]:
     duration = col1.number_input(
         "Số ngày nghỉ", min_value=0.5, max_value=30.0, step=0.5, value=1.0)
     start_date = col2.date_input("Ngày bắt đầu nghỉ", value=date.today())
-    end_date_default = start_date + timedelta(days=int(duration)-1)
+    # Ngày kết thúc mặc định: đủ số ngày làm việc, bỏ qua cuối tuần và ngày lễ
+    end_date_default = end_date_for(start_date, duration)
     end_date = col3.date_input("Ngày kết thúc nghỉ", value=end_date_default)
+    if end_date >= start_date:
+        st.caption(
+            f"📆 {working_days(start_date, end_date)} ngày làm việc từ {start_date:%d/%m/%Y} đến {end_date:%d/%m/%Y}")
+        missing_years = years_without_holidays(start_date, end_date)
+        if missing_years:
+            st.warning(
+                f"⚠️ Chưa có lịch nghỉ lễ năm {', '.join(map(str, missing_years))}: số ngày làm việc "
+                "chưa trừ ngày lễ. Vui lòng báo HR cập nhật bảng 'holidays'.")
+
+    # --- Cảnh báo trùng lịch ---
+    intervals = get_interval_index()
+    overlaps = intervals.overlapping(selected_name, start_date, end_date)
+    if overlaps:
+        st.warning("⚠️ Bạn đã có yêu cầu nghỉ trùng ngày: " + ", ".join(
+            f"{format_date(o['start_date'])} → {format_date(o['end_date'])} ({o['status']})"
+            for o in overlaps))
+    busy_days = intervals.busy_days(
+        department, start_date, end_date, exclude_name=selected_name)
+    if busy_days:
+        st.warning(
+            f"⚠️ Phòng {department} đã có từ {MAX_CONCURRENT_ABSENCES} người nghỉ vào: " + "; ".join(
+                f"{format_date(day)} ({', '.join(names)})" for day, names in busy_days.items()))
     reason_text = st.text_area("📝 Lý do chi tiết", height=100)
 
-    # --- Kiểm tra cooldown ---
-    now = datetime.now()
-    if st.session_state["last_submit_time"]:
-        elapsed = (now - st.session_state["last_submit_time"]).total_seconds()
-    else:
-        elapsed = cooldown_seconds + 1  # cho phép bấm lần đầu
-
-    button_disabled = elapsed < cooldown_seconds
-    cooldown_remaining = int(
-        cooldown_seconds - elapsed) if button_disabled else 0
+    # Giới hạn số lần gửi do send_leave_request kiểm tra (dùng chung mọi session, xem rate_limit.py)
+    if st.button("📨 Gửi yêu cầu"):
+        if not reason_text.strip():
+            st.warning("⚠️ Vui lòng nhập lý do nghỉ.")
+
+        else:
+            # Gọi hàm gửi yêu cầu (tự báo lỗi nếu số ngày không khớp / đã gửi rồi / gửi quá nhanh)
+            # Khóa theo nội dung: F5 hoặc mở nhiều tab rồi gửi lại vẫn ra cùng khóa
+            if send_leave_request(
+                selected_name, department, start_date,
+                end_date, duration, reason_text, leave_type, leave_case,
+                idempotency_key=make_idempotency_key(
+                    selected_name, start_date, end_date, leave_type, leave_case)
+            ):
+                st.success("✅ Yêu cầu đã được gửi!")
 
-    if button_disabled:
-        st.info(f"⏳ Vui lòng chờ {cooldown_remaining} giây trước khi gửi lại.")
-    else:
-        if st.button("📨 Gửi yêu cầu"):
-            if not reason_text.strip():
-                st.warning("⚠️ Vui lòng nhập lý do nghỉ.")
+    # Yêu cầu chưa ghi xong lúc gửi → hỏi lại mỗi 2 giây tới khi có kết quả
+    @st.fragment(run_every=2 if st.session_state.get("pending_submissions") else None)
+    def submission_status():
+        poll_pending_submissions()
+        for kind, text in st.session_state.get("submission_messages", []):
+            getattr(st, kind)(text)
 
-            else:
-                # Gọi hàm gửi yêu cầu
-                send_leave_request(
-                    selected_name, department, start_date,
-                    end_date, duration, reason_text, leave_type, leave_case
-                )
-                st.success("✅ Yêu cầu đã được gửi!")
-                # Lưu thời điểm lần bấm nút
-                st.session_state["last_submit_time"] = datetime.now()
+    submission_status()
     # ===============================
     # TAB 2: HR QUẢN LÝ
     # ===============================
     if len(tabs) > 1:
-        with tab_objects[1]:
+        with tab_objects[1], perf_block("Tab quản lý yêu cầu"):
             st.markdown("""
                 <h2 style='text-align: center; color: #1e3d59;'>
                     👩‍💼 Quản lý nghỉ phép
@@ -218,110 +266,233 @@ with tab_objects[0]:
                     "Tháng", options=month_options, index=datetime.now().month
                 )
 
-            # --- Lấy dữ liệu từ DB ---
-            leaves = view_leaves(query_status)
-
-            # --- Lọc theo tên ---
-            if search_name:
-                leaves = [l for l in leaves if search_name.lower() in l.get(
-                    "full_name", "").lower()]
-
-            # --- Lọc theo phòng ban ---
-            if department:
-                leaves = [l for l in leaves if l.get(
-                    "department") == department]
-
-            # --- Lọc theo tháng/năm ---
-            filtered_leaves = []
-            for leave in leaves:
-                try:
-                    start_date = leave.get("start_date")
-                    if not start_date:
-                        continue
-                    year = start_date[:4]
-                    month = start_date[5:7]
-
-                    # Điều kiện lọc động
-                    if (
-                        (selected_year == "Tất cả" or year == selected_year)
-                        and (selected_month == "Tất cả" or month == selected_month)
-                    ):
-                        filtered_leaves.append(leave)
-                except Exception:
-                    continue
-
-            def parse_requested_at(leave):
-                ra = leave.get("requested_at")
-                if not ra:
-                    return datetime.min
-                try:
-                    return datetime.strptime(ra, "%Y-%m-%d %H:%M:%S")
-                except:
-                    return datetime.min
-
-            # Sắp xếp giảm dần theo thời gian gửi
-            filtered_leaves.sort(key=parse_requested_at, reverse=True)
-
-            # --- Hiển thị kết quả ---
-            if not filtered_leaves:
-                st.info(
-                    f"🕊️ Không có yêu cầu nghỉ nào.")
-            else:
-                for leave in filtered_leaves:
-                    status = leave.get("status", "")
-
-                    # Tiêu đề expander bình thường
-                    expander_title = f"📄 {leave.get('full_name', '')} | 📌 {leave.get('leave_case', '')} | {status_badge(status)}"
-
-                    with st.expander(expander_title):
-                        st.write(
-                            f"**Phòng ban:** {leave.get('department', '')}")
-                        st.write(
-                            f"**Thời gian:** {leave.get('start_date')} → {leave.get('end_date')} ({leave.get('duration')} ngày)")
-                        st.write(f"**Loại nghỉ:** {leave.get('leave_type')}")
-                        st.write(
-                            f"**Trường hợp nghỉ:** {leave.get('leave_case')}")
-                        st.write(
-                            f"**Lý do chi tiết:** {leave.get('reason', '')}")
-
-                        # Hiển thị trạng thái với màu
-                        if status == "pending":
-                            st.write(f"**Trạng thái:** {status_badge(status)}")
-                        elif status == "approved":
-                            st.markdown(
-                                f"**Trạng thái:** <span style='color:green;'>{status}</span>", unsafe_allow_html=True)
-                        elif status == "rejected":
+            # --- Phân trang ---
+            col_size, col_refresh = st.columns([1, 1])
+            with col_size:
+                page_size = st.selectbox(
+                    "Số yêu cầu mỗi trang", [10, 20, 50, 100], index=1)
+
+            # Quay về trang 1 khi bộ lọc thay đổi
+            query_key = (search_name, query_status, department,
+                         selected_year, selected_month)
+            filter_key = query_key + (page_size,)
+            if st.session_state.get("hr_filter_key") != filter_key:
+                st.session_state["hr_filter_key"] = filter_key
+                st.session_state["hr_page"] = 1
+
+            # --- Trang của bộ lọc giữ trong session, chỉ truy vấn lại khi dữ liệu thay đổi ---
+            if st.session_state.get("hr_feed_key") != query_key:
+                st.session_state["hr_feed_key"] = query_key
+                st.session_state["hr_feed"] = LeaveFeed(dict(
+                    status_filter=query_status,
+                    search_name=search_name,
+                    department=department,
+                    year=None if selected_year == "Tất cả" else selected_year,
+                    month=None if selected_month == "Tất cả" else selected_month,
+                ))
+            feed = st.session_state["hr_feed"]
+
+            with col_refresh:
+                auto_refresh = st.toggle(
+                    f"Tự động cập nhật ({HR_REFRESH_SECONDS}s)", value=True, key="hr_auto_refresh")
+                st.button("🔄 Tải lại toàn bộ", key="hr_reload", on_click=feed.reload)
+
+            # Fragment: tự chạy lại định kỳ để hiện yêu cầu mới, không rerun cả trang
+            @st.fragment(run_every=HR_REFRESH_SECONDS if auto_refresh else None)
+            def hr_queue():
+                changes = feed.refresh()
+                filtered_leaves, total_leaves = feed.page(
+                    st.session_state["hr_page"], page_size)
+                total_pages = max((total_leaves + page_size - 1) // page_size, 1)
+                if st.session_state["hr_page"] > total_pages:
+                    # Số bản ghi giảm (vd. vừa duyệt xong) → lùi về trang cuối
+                    st.session_state["hr_page"] = total_pages
+                    filtered_leaves, total_leaves = feed.page(total_pages, page_size)
+
+                st.number_input(
+                    "Trang", min_value=1, max_value=total_pages, step=1, key="hr_page")
+                st.caption(
+                    f"Tìm thấy {total_leaves} yêu cầu · Trang {st.session_state['hr_page']}/{total_pages}"
+                    f" · Cập nhật lúc {datetime.now().strftime('%H:%M:%S')}"
+                    + (" · có thay đổi mới" if changes else ""))
+
+                # --- Duyệt / từ chối hàng loạt ---
+                pending_on_page = {
+                    str(l["_id"]): f"{l.get('full_name', '')} | {format_date(l.get('start_date'))} → {format_date(l.get('end_date'))} | {l.get('leave_case', '')}"
+                    for l in filtered_leaves if l.get("status") == "pending"
+                }
+
+                def run_batch_decision(decision):
+                    selected_ids = st.session_state.get("hr_batch_select", [])
+                    if selected_ids:
+                        st.session_state["hr_batch_results"] = decide_leaves(
+                            selected_ids, st.session_state.hr_username, decision)
+                        feed.invalidate()
+                        st.session_state["hr_table_nonce"] = st.session_state.get(
+                            "hr_table_nonce", 0) + 1
+                    st.session_state["hr_batch_select"] = []
+                    st.session_state["hr_batch_all"] = False
+
+                if pending_on_page:
+                    with st.expander(f"⚡ Xử lý hàng loạt ({len(pending_on_page)} yêu cầu chờ duyệt trong trang)"):
+                        # Bỏ các lựa chọn không còn trong trang (đã xử lý / đổi trang)
+                        st.session_state["hr_batch_select"] = [
+                            i for i in st.session_state.get("hr_batch_select", []) if i in pending_on_page]
+                        # Chỉ áp dụng lúc bấm ô "chọn tất cả" → HR vẫn bỏ chọn được từng dòng sau đó
+                        def toggle_select_all():
+                            st.session_state["hr_batch_select"] = (
+                                list(pending_on_page) if st.session_state["hr_batch_all"] else [])
+
+                        def sync_select_all():
+                            st.session_state["hr_batch_all"] = (
+                                set(st.session_state["hr_batch_select"]) == set(pending_on_page))
+
+                        st.checkbox("Chọn tất cả trong trang", key="hr_batch_all",
+                                    on_change=toggle_select_all)
+                        st.multiselect(
+                            "Chọn yêu cầu", options=list(pending_on_page),
+                            format_func=pending_on_page.get, key="hr_batch_select",
+                            on_change=sync_select_all)
+
+                        col_left, col_spacer, col_right = st.columns([1, 2, 1])
+                        with col_left:
+                            st.button("✅ Duyệt đã chọn", key="hr_batch_approve",
+                                      on_click=run_batch_decision, args=("approved",))
+                        with col_right:
+                            st.button("❌ Từ chối đã chọn", key="hr_batch_reject",
+                                      on_click=run_batch_decision, args=("rejected",))
+
+                batch_results = st.session_state.pop("hr_batch_results", None)
+                if batch_results:
+                    ok_count = sum(r["ok"] for r in batch_results)
+                    st.success(
+                        f"Đã xử lý {ok_count}/{len(batch_results)} yêu cầu.")
+                    failed = [r for r in batch_results if not r["ok"]]
+                    if failed:
+                        st.dataframe(failed, use_container_width=True)
+
+                def decide_and_reset(decide, leave_id):
+                    decide(leave_id, st.session_state.hr_username)
+                    feed.invalidate()
+                    # Danh sách thay đổi → bỏ dòng đang chọn để không trỏ nhầm yêu cầu khác
+                    st.session_state["hr_table_nonce"] = st.session_state.get(
+                        "hr_table_nonce", 0) + 1
+
+                # --- Hiển thị kết quả ---
+                # Bảng gọn 1 dòng/yêu cầu; chi tiết + nút chỉ dựng cho dòng HR đang mở
+                if not filtered_leaves:
+                    st.info(
+                        f"🕊️ Không có yêu cầu nghỉ nào.")
+                else:
+                    # Yêu cầu mới chen lên đầu trang → dòng đang chọn trỏ nhầm, nên reset lựa chọn
+                    page_ids = hash(tuple(l["_id"] for l in filtered_leaves))
+                    summary_rows = [{
+                        "Nhân viên": leave.get("full_name", ""),
+                        "Phòng ban": leave.get("department", ""),
+                        "Trường hợp": leave.get("leave_case", ""),
+                        "Từ ngày": format_date(leave.get("start_date")),
+                        "Đến ngày": format_date(leave.get("end_date")),
+                        "Số ngày": leave.get("duration"),
+                        "Trạng thái": status_badge(leave.get("status", "")),
+                    } for leave in filtered_leaves]
+
+                    table_event = st.dataframe(
+                        summary_rows, use_container_width=True, hide_index=True,
+                        on_select="rerun", selection_mode="single-row",
+                        key=f"hr_table_{st.session_state['hr_page']}_{st.session_state.get('hr_table_nonce', 0)}_{page_ids}")
+                    selected_rows = table_event.selection.rows
+
+                    if not selected_rows or selected_rows[0] >= len(filtered_leaves):
+                        st.caption("👆 Chọn một dòng để xem chi tiết và duyệt.")
+                    else:
+                        leave = filtered_leaves[selected_rows[0]]
+                        status = leave.get("status", "")
+
+                        with st.container(border=True):
                             st.markdown(
-                                f"**Trạng thái:** <span style='color:red;'>{status}</span>", unsafe_allow_html=True)
-                        else:
-                            st.write(f"**Trạng thái:** {status}")
-
-                        st.write(
-                            f"**Gửi lúc:** {leave.get('requested_at', '')}")
-                        st.markdown("<br>", unsafe_allow_html=True)
-
-                        if leave.get("approved_by"):
+                                f"#### 📄 {leave.get('full_name', '')} | 📌 {leave.get('leave_case', '')}")
                             st.write(
-                                f"**Phê duyệt bởi:** {leave.get('approved_by')} lúc {leave.get('approved_at')}")
-
-                        # Nút duyệt/từ chối chỉ cho pending
-                        if status == "pending":
-                            # Tạo 3 cột với khoảng cách giữa 2 nút
-                            col_left, col_spacer, col_right = st.columns([
-                                                                         1, 2, 1])
-
-                            with col_left:
-                                if st.button("✅ Duyệt", key=f"approve_{leave['_id']}"):
-                                    approve_leave(
-                                        leave["_id"], st.session_state.hr_username)
+                                f"**Phòng ban:** {leave.get('department', '')}")
+                            st.write(
+                                f"**Thời gian:** {format_date(leave.get('start_date'))} → {format_date(leave.get('end_date'))} ({leave.get('duration')} ngày)")
+                            st.write(f"**Loại nghỉ:** {leave.get('leave_type')}")
+                            st.write(
+                                f"**Trường hợp nghỉ:** {leave.get('leave_case')}")
+                            st.write(
+                                f"**Lý do chi tiết:** {leave.get('reason', '')}")
+
+                            # Hiển thị trạng thái với màu
+                            if status == "pending":
+                                st.write(f"**Trạng thái:** {status_badge(status)}")
+                            elif status == "approved":
+                                st.markdown(
+                                    f"**Trạng thái:** <span style='color:green;'>{status}</span>", unsafe_allow_html=True)
+                            elif status == "rejected":
+                                st.markdown(
+                                    f"**Trạng thái:** <span style='color:red;'>{status}</span>", unsafe_allow_html=True)
+                            else:
+                                st.write(f"**Trạng thái:** {status}")
 
-                            with col_right:
-                                if st.button("❌ Từ chối", key=f"reject_{leave['_id']}"):
-                                    reject_leave(
-                                        leave["_id"], st.session_state.hr_username)
+                            st.write(
+                                f"**Gửi lúc:** {format_date(leave.get('requested_at'), DATETIME_FORMAT)}")
+
+                            if leave.get("approved_by"):
+                                st.write(
+                                    f"**Phê duyệt bởi:** {leave.get('approved_by')} lúc {format_date(leave.get('approved_at'), DATETIME_FORMAT)}")
+
+                            # Nút duyệt/từ chối chỉ cho pending
+                            if status == "pending":
+                                # Cảnh báo trùng lịch trước khi duyệt
+                                intervals = get_interval_index()
+                                overlaps = intervals.overlapping(
+                                    leave.get("full_name"), leave.get("start_date"),
+                                    leave.get("end_date"), exclude_id=leave["_id"])
+                                if overlaps:
+                                    st.warning("⚠️ Trùng với yêu cầu khác của nhân viên: " + ", ".join(
+                                        f"{format_date(o['start_date'])} → {format_date(o['end_date'])} ({o['status']})"
+                                        for o in overlaps))
+                                busy_days = intervals.busy_days(
+                                    leave.get("department"), leave.get("start_date"),
+                                    leave.get("end_date"), exclude_name=leave.get("full_name"))
+                                if busy_days:
+                                    st.warning(
+                                        f"⚠️ Cùng phòng ban đã có từ {MAX_CONCURRENT_ABSENCES} người nghỉ vào: " + "; ".join(
+                                            f"{format_date(day)} ({', '.join(names)})" for day, names in busy_days.items()))
+
+                                # Tạo 3 cột với khoảng cách giữa 2 nút
+                                col_left, col_spacer, col_right = st.columns([
+                                                                             1, 2, 1])
+
+                                # on_click chạy trước lần rerun kế tiếp → danh sách hiển thị đã cập nhật
+                                with col_left:
+                                    st.button("✅ Duyệt", key=f"approve_{leave['_id']}",
+                                              on_click=decide_and_reset,
+                                              args=(approve_leave, leave["_id"]))
+
+                                with col_right:
+                                    st.button("❌ Từ chối", key=f"reject_{leave['_id']}",
+                                              on_click=decide_and_reset,
+                                              args=(reject_leave, leave["_id"]))
+
+            hr_queue()
+
+            # --- Kiểm tra số ngày nghỉ của toàn bộ yêu cầu ---
+            with st.expander("🧮 Kiểm tra số ngày nghỉ so với ngày làm việc"):
+                st.caption(
+                    "So sánh số ngày ghi trên yêu cầu với số ngày làm việc thực tế (bỏ cuối tuần, ngày lễ). "
+                    "Ngày lễ lấy từ bảng 'holidays' ở tab Sheets (cột date): thêm lịch nghỉ năm mới, sửa hoặc xóa tại đó.")
+                if st.button("Kiểm tra", key="audit_durations"):
+                    mismatched = audit_leave_durations()
+                    if mismatched.empty:
+                        st.success("✅ Tất cả yêu cầu chờ duyệt / đã duyệt đều khớp.")
+                    else:
+                        st.warning(f"⚠️ {len(mismatched)} yêu cầu có số ngày không khớp.")
+                        mismatched["start_date"] = mismatched["start_date"].map(format_date)
+                        mismatched["end_date"] = mismatched["end_date"].map(format_date)
+                        st.dataframe(mismatched, use_container_width=True, hide_index=True)
 
     if len(tabs) > 2:
-        with tab_objects[2]:
+        with tab_objects[2], perf_block("Tab dashboard nhân viên"):
             st.markdown("""
                 <h2 style='text-align: center; color: #1e3d59;'>
                     📊 Dashboard tổng hợp
@@ -333,14 +504,12 @@ with tab_objects[0]:
                 st.warning(
                     "⚠️ Bạn cần đăng nhập ở tab 'Dành cho HR' để xem Dashboard.")
                 st.stop()
-            employees = list(EMPLOYEES_COL.find({}, {"_id": 0}))
-            employee_names = [emp["full_name"] for emp in employees]
+            employee_names = [emp["full_name"] for emp in roster.all()]
 
             selected_emp_name = st.selectbox(
                 "👤 Chọn nhân viên", employee_names)
 
-            selected_emp = next(
-                (e for e in employees if e["full_name"] == selected_emp_name), None)
+            selected_emp = roster.get(selected_emp_name)
 
             if not selected_emp:
                 st.error("❌ Không tìm thấy thông tin nhân viên.")
@@ -433,58 +602,86 @@ with tab_objects[0]:
                 </div>
             """, unsafe_allow_html=True)
 
-            # --- Lấy toàn bộ dữ liệu nghỉ phép ---
-            all_leaves = list(LEAVES_COL.find())
+            # --- Dữ liệu tổng hợp nghỉ phép ---
             st.markdown("<br><br>", unsafe_allow_html=True)
-            if not all_leaves:
+            dashboard_backend = st.radio(
+                "Nguồn dữ liệu biểu đồ", DASHBOARD_BACKENDS, horizontal=True,
+                help="aggregate: tính trên MongoDB · pandas: kéo toàn bộ dữ liệu về để so sánh · "
+                     "parquet: đọc bản xuất của parquet_export.py")
+            if dashboard_backend == "parquet":
+                from parquet_export import snapshot_info
+                export = snapshot_info()
+                if export is None:
+                    st.warning("⚠️ Chưa có bản xuất Parquet (python parquet_export.py), "
+                               "biểu đồ đang dùng nguồn 'summary'.")
+                else:
+                    exported_at = datetime.fromisoformat(export["exported_at"])
+                    st.caption(
+                        f"📦 Bản xuất Parquet lúc {exported_at:{DATETIME_FORMAT}} (UTC) · "
+                        "sửa / xóa qua tab Sheets chỉ có sau lần xuất với --full")
+            dashboard = load_leave_dashboard(dashboard_backend)
+            if not dashboard:
                 st.info("Chưa có dữ liệu nghỉ phép.")
             else:
-                import pandas as pd
                 import plotly.express as px
 
-                df = pd.DataFrame(all_leaves)
-
-                df["year_month"] = (
-                    pd.to_datetime(df["start_date"], errors="coerce")
-                    .dt.to_period("M")
-                    .astype(str)
-                )
-
                 # --- Tổng số ngày nghỉ theo phòng ban ---
-                dept_summary = df.groupby("department")[
-                    "duration"].sum().reset_index()
-                fig1 = px.bar(dept_summary, x="department", y="duration",
+                fig1 = px.bar(dashboard["dept_summary"], x="department", y="duration",
                               title="🏢 Tổng số ngày nghỉ theo phòng ban",
                               text_auto=True)
                 st.plotly_chart(fig1, use_container_width=True)
 
                 # --- Biểu đồ trạng thái ---
-                status_summary = df["status"].value_counts().reset_index()
-                status_summary.columns = ["status", "count"]
-                fig2 = px.pie(status_summary, names="status", values="count",
+                fig2 = px.pie(dashboard["status_summary"], names="status", values="count",
                               title="📊 Tỷ lệ trạng thái nghỉ phép", hole=0.4)
                 st.plotly_chart(fig2, use_container_width=True)
 
                 # --- Biểu đồ theo tháng ---
-                monthly = df.groupby("year_month")[
-                    "duration"].sum().reset_index()
-                fig3 = px.line(monthly, x="year_month", y="duration",
+                fig3 = px.line(dashboard["monthly"], x="year_month", y="duration",
                                markers=True, title="📅 Tổng ngày nghỉ theo tháng")
                 st.plotly_chart(fig3, use_container_width=True)
 
+                # --- Lịch nghỉ: số người nghỉ mỗi ngày theo phòng ban ---
+                st.markdown("### 🗓️ Lịch nghỉ theo ngày")
+                first_of_month = date.today().replace(day=1)
+                col_range, col_status = st.columns([2, 1])
+                with col_range:
+                    calendar_range = st.date_input(
+                        "Khoảng ngày", value=(first_of_month, first_of_month + timedelta(days=60)),
+                        key="calendar_range")
+                with col_status:
+                    calendar_statuses = st.multiselect(
+                        "Trạng thái", CALENDAR_STATUSES, default=list(CALENDAR_STATUSES),
+                        key="calendar_statuses")
+
+                if len(calendar_range) == 2 and calendar_statuses:
+                    calendar_start, calendar_end = calendar_range
+                    if (calendar_end - calendar_start).days + 1 > CALENDAR_MAX_DAYS:
+                        st.caption(f"Chỉ hiển thị {CALENDAR_MAX_DAYS} ngày đầu của khoảng đã chọn.")
+                    calendar = load_absence_calendar(
+                        calendar_start, calendar_end, tuple(sorted(calendar_statuses)),
+                        get_data_version("leaves"))
+                    if calendar.empty or not calendar.to_numpy().any():
+                        st.info("Không có ai nghỉ trong khoảng này.")
+                    else:
+                        fig4 = px.imshow(
+                            calendar.T, aspect="auto", color_continuous_scale="Reds",
+                            labels={"x": "Ngày", "y": "Phòng ban", "color": "Số người nghỉ"},
+                            title="👥 Số người nghỉ mỗi ngày theo phòng ban")
+                        st.plotly_chart(fig4, use_container_width=True)
+
                 # --- Bảng chi tiết ---
                 st.markdown("### 📋 Bảng chi tiết nghỉ phép")
-                st.dataframe(df[["full_name", "department", "leave_type",
-                                "start_date", "end_date", "duration", "status"]])
+                st.dataframe(dashboard["detail"])
 
     if len(tabs) > 3:
-        with tab_objects[3]:
+        with tab_objects[3], perf_block("Tab dashboard HR"):
             # ================= Streamlit UI =================
             st.title("HR Dashboard - MongoDB Sheets")
 
             # 1️⃣ Lấy danh sách collection và loại bỏ 'admin'
             collections = [c for c in get_collections() if c.lower()
-                           != "admin"]
+                           not in INTERNAL_COLLECTIONS and not c.startswith("_")]
             if not collections:
                 st.warning(
                     "Hiện tại chưa có collection nào trong MongoDB (ngoại trừ admin).")
@@ -503,35 +700,131 @@ with tab_objects[0]:
                 key="select_col"
             )
 
-            # 4️⃣ Load dữ liệu từ collection đã chọn
-            df = load_collection(selected_col)
-            if df.empty:
+            # 4️⃣ Thông tin nhanh từ metadata (không tải dữ liệu)
+            meta = collection_metadata(selected_col)
+            st.caption(
+                f"≈ {meta['count']:,} dòng · {len(meta['fields'])} cột")
+
+            # Chọn cột (projection) và trang → chỉ tải một trang từ MongoDB
+            col_fields, col_size, col_page = st.columns([3, 1, 1])
+            fields_key = f"sheet_fields_{selected_col}"
+            st.session_state[fields_key] = [
+                f for f in st.session_state.get(fields_key, meta["fields"][:SHEET_DEFAULT_COLUMNS])
+                if f in meta["fields"]]
+            with col_fields:
+                selected_fields = st.multiselect(
+                    "Cột hiển thị", meta["fields"], key=fields_key)
+            with col_size:
+                sheet_page_size = st.selectbox(
+                    "Số dòng/trang", [50, 100, 200, 500], index=1,
+                    key=f"sheet_size_{selected_col}")
+            sheet_pages = max(
+                (meta["count"] + sheet_page_size - 1) // sheet_page_size, 1)
+            page_key = f"sheet_page_{selected_col}"
+            if st.session_state.get(page_key, 1) > sheet_pages:
+                st.session_state[page_key] = sheet_pages
+            with col_page:
+                sheet_page = st.number_input(
+                    "Trang", min_value=1, max_value=sheet_pages, step=1, key=page_key)
+
+            df = load_collection(
+                selected_col, fields=selected_fields or None,
+                skip=(sheet_page - 1) * sheet_page_size, limit=sheet_page_size)
+            if meta["count"] == 0 and df.empty:
                 st.info(
-                    "Collection này đang trống. HR có thể upload CSV hoặc thêm trực tiếp.")
+                    "Collection này đang trống. HR có thể import CSV/Excel bên dưới hoặc thêm trực tiếp.")
 
-            # 4️⃣ Hiển thị và edit trực tiếp
+            # Hiển thị và edit trực tiếp; key đổi theo trang/cột và sau mỗi lần lưu
+            # để thay đổi đã lưu không bị data_editor áp lại lần nữa
+            editor_nonce = st.session_state.get(f"editor_nonce_{selected_col}", 0)
             edited_df = st.data_editor(
                 df,
                 num_rows="dynamic",
                 use_container_width=True,
-                key=f"editor_{selected_col}"
+                disabled=["_id", "_version"],
+                key=f"editor_{selected_col}_{sheet_page}_{sheet_page_size}_{'|'.join(selected_fields)}_{editor_nonce}"
             )
 
-            # 5️⃣ Lưu dữ liệu sau khi edit
+            # 5️⃣ Lưu dữ liệu sau khi edit (chỉ các dòng/cột của trang đang mở)
             if st.button("Lưu thay đổi về MongoDB", key=f"save_btn_{selected_col}"):
                 if edited_df.empty:
                     st.warning("Không có dữ liệu để lưu.")
                 else:
-                    save_dataframe(selected_col, edited_df)
-                    st.success(f"Đã lưu thay đổi vào bảng {selected_col}!")
-                    df = load_collection(selected_col)
-
-            # 6️⃣ Tải dữ liệu Excel
-            if not df.empty:
-                st.download_button(
-                    label="Tải dữ liệu Excel",
-                    data=to_excel(df),
-                    file_name=f"{selected_col}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    key=f"download_{selected_col}"
-                )
+                    stats = save_dataframe(
+                        selected_col, edited_df, original_df=df)
+                    collection_metadata.clear()
+                    st.session_state[f"editor_nonce_{selected_col}"] = editor_nonce + 1
+                    st.session_state["sheet_save_message"] = (
+                        f"Đã lưu thay đổi vào bảng {selected_col}! "
+                        f"(thêm {stats['inserted']}, sửa {stats['updated']}, xóa {stats['deleted']})")
+                    st.session_state["sheet_save_conflicts"] = stats["conflicts"]
+                    st.rerun()
+            if "sheet_save_message" in st.session_state:
+                st.success(st.session_state.pop("sheet_save_message"))
+            save_conflicts = st.session_state.pop("sheet_save_conflicts", None)
+            if save_conflicts:
+                st.warning(
+                    f"⚠️ {len(save_conflicts)} dòng đã bị người khác sửa/xóa trước khi bạn lưu nên không được ghi đè. "
+                    "Dữ liệu mới nhất đã được tải lại, vui lòng sửa lại các dòng này:")
+                st.code("\n".join(save_conflicts))
+
+            # 7️⃣ Import CSV/Excel (đọc từng chunk, upsert theo cột khóa)
+            with st.expander("📥 Import CSV / Excel"):
+                uploaded = st.file_uploader(
+                    "Chọn file", type=["csv", "xlsx"], key=f"import_file_{selected_col}")
+                # Chỉ _id và cột đã có index; cột không unique: dòng khớp nhiều document bị bỏ qua
+                key_options = list(import_key_columns(selected_col))
+                key_column = st.selectbox(
+                    "Cột khóa (dòng trùng khóa sẽ được cập nhật)", key_options, index=0,
+                    help="_id: dòng không có _id được thêm mới · cột khác phải có index, "
+                         "khóa khớp nhiều dòng trong DB sẽ bị bỏ qua",
+                    key=f"import_key_{selected_col}")
+
+                if uploaded and st.button("Bắt đầu import", key=f"import_btn_{selected_col}"):
+                    progress_bar = st.progress(0.0, text="Đang đọc file...")
+
+                    def show_progress(rows):
+                        # CSV: ước lượng theo vị trí đọc trong file; XLSX: chỉ báo số dòng
+                        fraction = min(uploaded.tell() / uploaded.size, 1.0) \
+                            if uploaded.name.lower().endswith(".csv") and uploaded.size else 0.0
+                        progress_bar.progress(
+                            fraction, text=f"Đã xử lý {rows:,} dòng")
+
+                    try:
+                        report = import_file(
+                            selected_col, uploaded, uploaded.name, key_column, progress=show_progress)
+                    except ValueError as e:
+                        st.error(f"❌ {e}")
+                    else:
+                        progress_bar.progress(
+                            1.0, text=f"Xong {report['rows']:,} dòng")
+                        collection_metadata.clear()
+                        st.session_state[f"editor_nonce_{selected_col}"] = editor_nonce + 1
+                        st.success(
+                            f"Thêm {report['inserted']:,} · cập nhật {report['updated']:,} · "
+                            f"bỏ qua {report['skipped']:,} dòng lỗi")
+                        if report["errors"]:
+                            st.dataframe(report["errors"],
+                                         use_container_width=True, hide_index=True)
+
+            # 6️⃣ Tải dữ liệu Excel toàn bộ collection (chỉ build khi HR yêu cầu, cache theo version dữ liệu)
+            if meta["count"] or not df.empty:
+                excel_key = f"excel_ready_{selected_col}"
+                if st.button("Chuẩn bị file Excel", key=f"prepare_excel_{selected_col}"):
+                    st.session_state[excel_key] = True
+
+                if st.session_state.get(excel_key):
+                    st.download_button(
+                        label="Tải dữ liệu Excel",
+                        data=export_collection_excel(
+                            selected_col, get_data_version(selected_col)),
+                        file_name=f"{selected_col}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        key=f"download_{selected_col}"
+                    )
+
+# ===============================
+# HIỆU NĂNG (chỉ HR)
+# ===============================
+if st.session_state.get("hr_logged_in"):
+    render_perf_panel(perf_panel)
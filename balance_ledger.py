@@ -0,0 +1,161 @@
+# balance_ledger.py
+"""
+Sổ trừ phép (collection balance_ledger): mỗi yêu cầu "Nghỉ phép năm" đã duyệt có đúng một dòng
+- _id của dòng sổ = _id của yêu cầu nghỉ → ghi lại nhiều lần vẫn chỉ có một dòng
+- Trừ phép gồm 3 bước, bước nào bị ngắt giữa chừng cũng hoàn tất lại được:
+  1. ghi dòng sổ state "pending"
+  2. $inc remaining_days và đánh dấu _id vào employees._deducted_leaves (chặn trừ 2 lần)
+  3. đổi dòng sổ sang "applied" rồi $pull _id khỏi _deducted_leaves
+  → _deducted_leaves chỉ còn các lần trừ đang dở, không dài ra theo số lần duyệt
+- reconcile_balances(): hoàn tất các lần trừ bị ngắt (process chết giữa các bước) và trừ cho
+  yêu cầu đã duyệt mà chưa có dòng sổ (chết ngay sau khi đổi trạng thái)
+Chạy định kỳ (cron), một tiến trình mỗi lần:  python balance_ledger.py [--days 30] [--dry-run]
+
+Biến môi trường: LEDGER_GRACE_SECONDS (300) — bỏ qua các lần trừ mới hơn, có thể vẫn đang chạy
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from settings import BALANCE_LEDGER_COL, EMPLOYEES_COL, LEAVES_COL
+from versioning import new_version, VERSION_FIELD
+
+ANNUAL_LEAVE = "Nghỉ phép năm"
+DEDUCTED_FIELD = "_deducted_leaves"  # _id (string) đã $inc nhưng chưa đánh dấu applied
+PENDING, APPLIED = "pending", "applied"
+DUPLICATE_KEY = 11000
+LEDGER_GRACE = timedelta(seconds=int(os.environ.get("LEDGER_GRACE_SECONDS", 300)))
+RECONCILE_DAYS = 30
+
+
+def _duration(leave):
+    try:
+        return float(leave.get("duration") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _leave_id(value):
+    """_id trong _deducted_leaves lưu dạng string (tab Sheets hiển thị được)"""
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def _apply(entries, now):
+    """Bước 2 + 3 cho các dòng sổ; trả về số nhân viên bị trừ"""
+    if not entries:
+        return 0
+    marks = [str(e["_id"]) for e in entries]
+    result = EMPLOYEES_COL.bulk_write([UpdateOne(
+        {"full_name": e["full_name"], DEDUCTED_FIELD: {"$ne": mark}},
+        {"$inc": {"remaining_days": -e["duration"]},
+         "$push": {DEDUCTED_FIELD: mark},
+         "$set": {VERSION_FIELD: new_version()}},
+    ) for e, mark in zip(entries, marks)], ordered=False)
+    _settle([e["_id"] for e in entries], now)
+    return result.modified_count
+
+
+def _settle(leave_ids, now):
+    """Bước 3: đã $inc → đánh dấu applied, gỡ khỏi _deducted_leaves"""
+    BALANCE_LEDGER_COL.update_many(
+        {"_id": {"$in": leave_ids}}, {"$set": {"state": APPLIED, "applied_at": now}})
+    marks = [str(i) for i in leave_ids]
+    EMPLOYEES_COL.update_many(
+        {DEDUCTED_FIELD: {"$in": marks}}, {"$pull": {DEDUCTED_FIELD: {"$in": marks}}})
+
+
+def deduct_balances(leaves, now=None):
+    """
+    Trừ phép cho các yêu cầu vừa được duyệt (chỉ "Nghỉ phép năm")
+    - Yêu cầu đã có dòng sổ thì bỏ qua: đã trừ, hoặc reconcile_balances sẽ hoàn tất
+    - Trả về số nhân viên bị trừ
+    """
+    now = now or datetime.utcnow().replace(microsecond=0)
+    entries = [{"_id": leave["_id"], "full_name": leave.get("full_name"),
+                "duration": _duration(leave), "state": PENDING, "created_at": now}
+               for leave in leaves if leave.get("leave_type") == ANNUAL_LEAVE]
+    if not entries:
+        return 0
+    try:
+        BALANCE_LEDGER_COL.bulk_write([InsertOne(e) for e in entries], ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY for err in errors):
+            raise
+        existing = {err["index"] for err in errors}
+        entries = [entry for i, entry in enumerate(entries) if i not in existing]
+    return _apply(entries, now)
+
+
+def reconcile_balances(days=RECONCILE_DAYS, dry_run=False):
+    """
+    Đối chiếu sổ trừ phép với employees / leaves
+    - Trả về {"in_progress", "pending", "missing"}: số lần trừ được hoàn tất ở mỗi bước
+    """
+    now = datetime.utcnow().replace(microsecond=0)
+    settled_before = now - LEDGER_GRACE
+    report = {"in_progress": 0, "pending": 0, "missing": 0}
+
+    # _id còn trong _deducted_leaves = đã $inc (kể cả mảng cũ từ trước khi có sổ)
+    # → chỉ còn thiếu bước 3
+    marked = [(emp.get("full_name"), mark) for emp in EMPLOYEES_COL.find(
+        {DEDUCTED_FIELD: {"$exists": True, "$ne": []}}, {"full_name": 1, DEDUCTED_FIELD: 1})
+        for mark in emp[DEDUCTED_FIELD]]
+    report["in_progress"] = len(marked)
+    if marked and not dry_run:
+        BALANCE_LEDGER_COL.bulk_write([UpdateOne(
+            {"_id": _leave_id(mark)},
+            {"$setOnInsert": {"full_name": name, "migrated": True}},
+            upsert=True) for name, mark in marked], ordered=False)
+        _settle([_leave_id(mark) for _, mark in marked], now)
+
+    # Dòng sổ "pending" đủ cũ và không còn trong mảng đánh dấu → bước 2 chưa chạy
+    pending = list(BALANCE_LEDGER_COL.find(
+        {"state": PENDING, "created_at": {"$lt": settled_before}}))
+    report["pending"] = len(pending)
+    if not dry_run:
+        _apply(pending, now)
+
+    # Yêu cầu đã duyệt nhưng chưa có dòng sổ; chỉ xét từ lúc bắt đầu dùng sổ
+    # (yêu cầu duyệt trước đó đã được trừ theo cách cũ)
+    first = BALANCE_LEDGER_COL.find_one(
+        {"migrated": {"$ne": True}}, {"created_at": 1}, sort=[("created_at", 1)])
+    if first:
+        since = max(now - timedelta(days=days), first["created_at"])
+        approved = list(LEAVES_COL.find(
+            {"status": "approved", "leave_type": ANNUAL_LEAVE,
+             "approved_at": {"$gte": since, "$lt": settled_before}},
+            {"full_name": 1, "duration": 1, "leave_type": 1}))
+        known = {d["_id"] for d in BALANCE_LEDGER_COL.find(
+            {"_id": {"$in": [l["_id"] for l in approved]}}, {"_id": 1})}
+        missing = [l for l in approved if l["_id"] not in known]
+        report["missing"] = len(missing)
+        if missing and not dry_run:
+            deduct_balances(missing, now)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đối chiếu sổ trừ phép")
+    parser.add_argument("--days", type=int, default=RECONCILE_DAYS,
+                        help="Chỉ xét yêu cầu được duyệt trong số ngày gần nhất")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Chỉ đếm, không ghi")
+    args = parser.parse_args(argv)
+
+    report = reconcile_balances(days=args.days, dry_run=args.dry_run)
+    print(f"Đang dở (đã trừ, chưa đánh dấu): {report['in_progress']}")
+    print(f"Đã ghi sổ, chưa trừ: {report['pending']}")
+    print(f"Đã duyệt, chưa có dòng sổ: {report['missing']}")
+    if args.dry_run and any(report.values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
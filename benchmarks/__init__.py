@@ -0,0 +1,9 @@
+# benchmarks/__init__.py
+"""
+Benchmark cho các luồng nóng của app
+- Chạy trên DB riêng (mặc định "leave_management_bench"), KHÔNG chạy trên DB thật
+- Kết nối qua biến môi trường MONGO_URL
+"""
+import os
+
+os.environ.setdefault("MONGO_DB_NAME", "leave_management_bench")
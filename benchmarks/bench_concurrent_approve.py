@@ -0,0 +1,107 @@
+# benchmarks/bench_concurrent_approve.py
+"""
+Nhiều HR cùng bấm "Duyệt" một lúc: so sánh cách cũ (find_one → update_one → $inc)
+với decide_leaves (find_one_and_update có điều kiện + sổ trừ phép balance_ledger)
+
+Chạy:  MONGO_URL=mongodb://localhost:27017 python -m benchmarks.bench_concurrent_approve
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+import benchmarks  # noqa: F401  (chọn DB benchmark trước khi import settings)
+from settings import DB_NAME, LEAVES_COL, EMPLOYEES_COL, BALANCE_LEDGER_COL
+from functions import decide_leaves
+
+INITIAL_DAYS = 100.0
+
+
+def legacy_approve(leave_id, hr_name):
+    """Cách cũ của approve_leave (bỏ sleep/UI): 3 round trip, không có điều kiện"""
+    leave = LEAVES_COL.find_one({"_id": leave_id})
+    LEAVES_COL.update_one({"_id": leave_id}, {"$set": {
+        "status": "approved", "approved_by": hr_name,
+        "approved_at": datetime.utcnow()}})
+    if leave and leave.get("leave_type") == "Nghỉ phép năm":
+        EMPLOYEES_COL.update_one({"full_name": leave["full_name"]}, {
+                                 "$inc": {"remaining_days": -float(leave.get("duration", 0))}})
+
+
+def new_approve(leave_id, hr_name):
+    decide_leaves([leave_id], hr_name, "approved")
+
+
+def seed(n_leaves):
+    LEAVES_COL.delete_many({})
+    EMPLOYEES_COL.delete_many({})
+    BALANCE_LEDGER_COL.delete_many({})
+    EMPLOYEES_COL.insert_one({"full_name": "Bench User", "department": "IT",
+                              "remaining_days": INITIAL_DAYS})
+    result = LEAVES_COL.insert_many([{
+        "full_name": "Bench User", "department": "IT",
+        "start_date": datetime(2025, 1, 6), "end_date": datetime(2025, 1, 6), "duration": 1.0,
+        "leave_type": "Nghỉ phép năm", "leave_case": "Phép năm", "status": "pending",
+        "requested_at": datetime(2025, 1, 1, 8), "approved_by": None, "approved_at": None,
+    } for _ in range(n_leaves)])
+    return result.inserted_ids
+
+
+def run(approve, n_leaves, n_hr):
+    """n_hr luồng cùng duyệt toàn bộ n_leaves yêu cầu"""
+    leave_ids = seed(n_leaves)
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(n_hr)
+
+    def worker(hr_index):
+        barrier.wait()
+        for leave_id in leave_ids:
+            t0 = time.perf_counter()
+            approve(leave_id, f"hr{hr_index}")
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_hr)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    remaining = EMPLOYEES_COL.find_one(
+        {"full_name": "Bench User"})["remaining_days"]
+    expected = INITIAL_DAYS - n_leaves
+    return {
+        "leaves": n_leaves,
+        "hr_users": n_hr,
+        "expected_remaining_days": expected,
+        "remaining_days": remaining,
+        "double_deducted_days": expected - remaining,
+        "latency_ms_median": round(statistics.median(latencies), 3),
+        "latency_ms_p95": round(statistics.quantiles(latencies, n=20)[-1], 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--leaves", type=int, default=50)
+    parser.add_argument("--hr", type=int, default=4,
+                        help="Số HR bấm duyệt đồng thời")
+    args = parser.parse_args(argv)
+
+    if DB_NAME == "leave_management":
+        sys.exit("Không chạy benchmark trên DB thật, hãy đặt MONGO_DB_NAME")
+
+    report = {
+        "legacy": run(legacy_approve, args.leaves, args.hr),
+        "atomic": run(new_approve, args.leaves, args.hr),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report["atomic"]["double_deducted_days"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
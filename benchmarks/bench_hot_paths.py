@@ -0,0 +1,168 @@
+# benchmarks/bench_hot_paths.py
+"""
+Đo thời gian các luồng nóng theo kích thước dữ liệu, xuất JSON để so sánh giữa các lần chạy
+
+Chạy:
+  MONGO_URL=mongodb://localhost:27017 python -m benchmarks.bench_hot_paths --sizes 1000,10000,100000
+  python -m benchmarks.bench_hot_paths --backend mongomock --sizes 1000,10000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+import benchmarks  # noqa: F401  (chọn DB benchmark trước khi import settings)
+from benchmarks.datagen import make_employees, make_leaves
+from leave_dates import format_date, to_datetime
+
+
+def legacy_hr_filter(leaves, search_name, department, selected_year, selected_month):
+    """Cách lọc cũ của tab HR: lọc + sắp xếp bằng Python trên toàn bộ danh sách"""
+    if search_name:
+        leaves = [l for l in leaves if search_name.lower()
+                  in l.get("full_name", "").lower()]
+    if department:
+        leaves = [l for l in leaves if l.get("department") == department]
+    filtered = []
+    for l in leaves:
+        start_date = format_date(l.get("start_date"))
+        if start_date and (selected_year is None or start_date[:4] == selected_year) \
+                and (selected_month is None or start_date[5:7] == selected_month):
+            filtered.append(l)
+
+    def parse_requested_at(leave):
+        return to_datetime(leave.get("requested_at")) or datetime.min
+    filtered.sort(key=parse_requested_at, reverse=True)
+    return filtered
+
+
+def timed(fn, repeat):
+    """Chạy fn `repeat` lần, trả về thời gian (ms) median/min và lỗi nếu có"""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:  # backend không hỗ trợ (vd. mongomock thiếu operator)
+            return {"error": f"{type(e).__name__}: {e}"}
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3),
+            "min_ms": round(min(samples), 3)}
+
+
+def run_size(n_leaves, n_employees, repeat, seed, date_format="datetime"):
+    from settings import LEAVES_COL, EMPLOYEES_COL, LEAVE_SUMMARY_COL
+    from functions import (view_leaves, query_leaves, load_collection,
+                           save_dataframe, to_excel)
+    from dashboard_data import load_leave_dashboard
+    from leave_summary import rebuild_leave_summary
+    from leave_intervals import LeaveIntervalIndex
+    from dashboard_data import fetch_calendar_leaves, absence_matrix
+
+    employees = make_employees(n_employees, seed)
+    leaves = make_leaves(n_leaves, employees, seed, date_format=date_format)
+    for col in (LEAVES_COL, EMPLOYEES_COL, LEAVE_SUMMARY_COL):
+        col.delete_many({})
+    EMPLOYEES_COL.insert_many(employees)
+    for i in range(0, len(leaves), 10000):
+        LEAVES_COL.insert_many(leaves[i:i + 10000])
+
+    filters = {"search_name": "nguyễn", "department": "IT",
+               "year": "2025", "month": "03"}
+    results = {
+        # Dựng bảng tổng hợp cho dashboard "summary"; mongomock không có $type → báo lỗi, chạy tiếp
+        "summary_rebuild": timed(rebuild_leave_summary, 1),
+        "hr_tab_legacy": timed(lambda: legacy_hr_filter(
+            view_leaves(None), filters["search_name"], filters["department"],
+            filters["year"], filters["month"]), repeat),
+        "hr_tab_query": timed(lambda: query_leaves(**filters, page=1, page_size=20), repeat),
+        "dashboard_pandas": timed(lambda: load_leave_dashboard("pandas"), repeat),
+        "dashboard_aggregate": timed(lambda: load_leave_dashboard("aggregate"), repeat),
+        "dashboard_summary": timed(lambda: load_leave_dashboard("summary"), repeat),
+        "load_collection_leaves": timed(lambda: load_collection("leaves"), repeat),
+    }
+
+    # Lịch nghỉ cả năm: đọc từ DB và phần trải ngày bằng NumPy đo riêng
+    year_start, year_end = date(2025, 1, 1), date(2025, 12, 31)
+    calendar_leaves = fetch_calendar_leaves(year_start, year_end)
+    results["absence_calendar_fetch"] = timed(
+        lambda: fetch_calendar_leaves(year_start, year_end), repeat)
+    results["absence_calendar_expand"] = timed(
+        lambda: absence_matrix(calendar_leaves, year_start, year_end), repeat)
+
+    # Chỉ mục khoảng ngày: dựng một lần, sau đó mỗi lần kiểm tra trùng lịch chỉ là tra cứu
+    intervals = LeaveIntervalIndex()
+    results["intervals_build"] = timed(intervals.refresh, 1)
+    sample = leaves[:200]
+    results["intervals_check_200_requests"] = timed(lambda: [
+        (intervals.overlapping(l["full_name"], l["start_date"], l["end_date"]),
+         intervals.busy_days(l["department"], l["start_date"], l["end_date"], l["full_name"]))
+        for l in sample], repeat)
+
+    # save_dataframe: sửa ~1% số dòng của bảng employees như khi HR chỉnh trên data_editor
+    original = load_collection("employees")
+
+    def save_edits():
+        edited = original.copy()
+        step = max(len(edited) // 100, 1)
+        edited.loc[::step, "remaining_days"] = edited.loc[::step,
+                                                          "remaining_days"] + 0.5
+        save_dataframe("employees", edited, original_df=original)
+    results["save_dataframe_employees_1pct"] = timed(save_edits, 1)
+
+    leaves_df = load_collection("leaves")
+    results["to_excel_leaves"] = timed(lambda: to_excel(leaves_df), 1)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các luồng nóng")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod",
+                        help="mongod: kết nối MONGO_URL · mongomock: DB giả trong bộ nhớ")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Số yêu cầu nghỉ, phân cách bằng dấu phẩy")
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--date-format", choices=["datetime", "string"], default="datetime",
+                        help="Kiểu lưu ngày của dữ liệu sinh ra (string = trước khi migrate)")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định in ra stdout)")
+    args = parser.parse_args(argv)
+
+    if args.backend == "mongomock":
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient  # settings.py import sau dòng này
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+    from settings import DB_NAME
+    if DB_NAME == "leave_management":
+        sys.exit("Không chạy benchmark trên DB thật, hãy đặt MONGO_DB_NAME")
+
+    report = {
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "employees": args.employees,
+        "date_format": args.date_format,
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        report["results"][str(size)] = run_size(
+            size, args.employees, args.repeat, args.seed, args.date_format)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# benchmarks/bench_startup.py
+"""
+Đo thời gian khởi động: import các module của app và thời gian render lần đầu tab "📝 Yêu cầu"
+- Mỗi phép đo chạy trong một process Python mới (cold start)
+- --compare REF: đo thêm một commit khác (vd. baseline) qua git worktree tạm để so sánh trước/sau
+
+Chạy:
+  MONGO_URL=mongodb://localhost:27017 python -m benchmarks.bench_startup --compare HEAD~1
+  python -m benchmarks.bench_startup --backend mongomock
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ("pymongo", "pandas", "numpy", "openpyxl", "xlsxwriter", "plotly")
+
+# Chạy trong process con, cwd = thư mục mã nguồn cần đo
+_PROBE = r'''
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+mode, backend = sys.argv[1], sys.argv[2]
+if backend == "mongomock":
+    import mongomock, pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+
+result = {}
+if mode == "import":
+    t0 = time.perf_counter()
+    import functions, dashboard_data  # noqa: F401
+    result["import_ms"] = (time.perf_counter() - t0) * 1000
+else:
+    from streamlit.testing.v1 import AppTest
+    t0 = time.perf_counter()
+    at = AppTest.from_file("app.py", default_timeout=120)
+    at.secrets["MONGO_URL"] = os.environ["MONGO_URL"]
+    at.run()
+    result["first_render_ms"] = (time.perf_counter() - t0) * 1000
+    result["exceptions"] = [str(e.value) for e in at.exception]
+result["loaded"] = [m for m in %r if m in sys.modules]
+print(json.dumps(result))
+''' % (HEAVY_MODULES,)
+
+
+def _probe(tree, mode, backend):
+    out = subprocess.run([sys.executable, "-c", _PROBE, mode, backend], cwd=tree,
+                         capture_output=True, text=True, check=True, env=os.environ.copy())
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(tree, backend, repeat):
+    imports = [_probe(tree, "import", backend) for _ in range(repeat)]
+    renders = [_probe(tree, "render", backend) for _ in range(repeat)]
+    return {
+        "import_ms_median": round(statistics.median(r["import_ms"] for r in imports), 1),
+        "first_render_ms_median": round(statistics.median(r["first_render_ms"] for r in renders), 1),
+        "modules_after_import": imports[0]["loaded"],
+        "modules_after_first_render": renders[0]["loaded"],
+        "render_exceptions": renders[0]["exceptions"],
+    }
+
+
+def _prepare_worktree(ref, path):
+    """Checkout ref vào thư mục tạm; bản cũ chỉ đọc MONGO_URL từ secrets.toml"""
+    subprocess.run(["git", "worktree", "add", "--detach", path, ref],
+                   check=True, capture_output=True)
+    os.makedirs(os.path.join(path, ".streamlit"), exist_ok=True)
+    with open(os.path.join(path, ".streamlit", "secrets.toml"), "w") as f:
+        f.write(f'MONGO_URL = "{os.environ["MONGO_URL"]}"\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", metavar="REF",
+                        help="Commit/branch để so sánh (vd. baseline)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    import benchmarks  # noqa: F401  (MONGO_DB_NAME cho process con)
+
+    repo = os.getcwd()
+    report = {"backend": args.backend, "current": measure(repo, args.backend, args.repeat)}
+
+    if args.compare:
+        path = tempfile.mkdtemp(prefix="bench_startup_")
+        shutil.rmtree(path)
+        try:
+            _prepare_worktree(args.compare, path)
+            report[args.compare] = measure(path, args.backend, args.repeat)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", path],
+                           capture_output=True)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
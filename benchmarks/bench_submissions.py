@@ -0,0 +1,155 @@
+# benchmarks/bench_submissions.py
+"""
+Cuối tháng nhiều nhân viên gửi yêu cầu cùng lúc: so sánh cách cũ (insert_one + $inc tổng hợp
++ tăng version ngay trong luồng Streamlit) với hàng đợi ghi nền (submission_queue)
+- Độ trễ mỗi lần gửi (thời gian UI phải chờ: submit + chờ ghi xong) và số lệnh ghi xuống MongoDB
+- Mỗi nhân viên bấm gửi 2 lần (bấm đúp / F5) → đếm số bản ghi trùng
+
+Chạy:  MONGO_URL=mongodb://localhost:27017 python -m benchmarks.bench_submissions
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from pymongo import monitoring
+
+import benchmarks  # noqa: F401  (chọn DB benchmark trước khi import settings)
+
+WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify"}
+
+
+class WriteCounter(monitoring.CommandListener):
+    """Đếm lệnh ghi gửi tới server (chỉ có với mongod thật)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name in WRITE_COMMANDS:
+            with self._lock:
+                self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def make_leave(i):
+    return {
+        "full_name": f"Nhân viên {i:05d}", "department": "IT",
+        "start_date": datetime(2025, 2, 3), "end_date": datetime(2025, 2, 3), "duration": 1.0,
+        "reason": "bench", "leave_type": "Nghỉ phép năm", "leave_case": "Phép năm",
+        "status": "pending", "requested_at": datetime(2025, 1, 31, 17),
+        "approved_by": None, "approved_at": None,
+    }
+
+
+def legacy_submit(leave):
+    """Cách cũ của send_leave_request: ghi đồng bộ, không chống trùng"""
+    from settings import LEAVES_COL
+    from leave_summary import add_leave_to_summary
+    from versioning import bump_data_version
+
+    leave = dict(leave)
+    LEAVES_COL.insert_one(leave)
+    add_leave_to_summary(leave)
+    bump_data_version("leaves")
+
+
+def run(mode, n_employees, n_threads, counter):
+    from settings import LEAVES_COL, LEAVE_SUMMARY_COL
+    from submission_queue import (SubmissionQueue, make_idempotency_key, IDEMPOTENCY_FIELD,
+                                  QUEUED, WAIT_SECONDS)
+    from indexes import ensure_indexes
+
+    LEAVES_COL.delete_many({})
+    LEAVE_SUMMARY_COL.delete_many({})
+    ensure_indexes()
+    # Spool riêng cho benchmark: vẫn tính chi phí ghi file, không đụng spool của app
+    submissions = SubmissionQueue(spool_dir=tempfile.mkdtemp()) if mode == "queue" else None
+
+    def submit(i):
+        leave = make_leave(i)
+        if submissions is None:
+            legacy_submit(leave)
+            return
+        leave[IDEMPOTENCY_FIELD] = make_idempotency_key(
+            leave["full_name"], leave["start_date"], leave["end_date"],
+            leave["leave_type"], leave["leave_case"])
+        # Như send_leave_request: UI chờ tới khi ghi xong (tối đa SUBMIT_WAIT_MS)
+        if submissions.submit(leave) == QUEUED:
+            submissions.wait(leave[IDEMPOTENCY_FIELD], WAIT_SECONDS)
+
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(n_threads)
+    employees = list(range(n_employees))
+
+    def worker(offset):
+        barrier.wait()
+        for i in employees[offset::n_threads]:
+            for _ in range(2):  # bấm đúp
+                t0 = time.perf_counter()
+                submit(i)
+                with lock:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+    counter.count = 0
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    submitted_s = time.perf_counter() - t0
+    if submissions is not None:
+        submissions.flush()
+    durable_s = time.perf_counter() - t0
+
+    stored = LEAVES_COL.count_documents({})
+    return {
+        "employees": n_employees,
+        "threads": n_threads,
+        "latency_ms_median": round(statistics.median(latencies), 3),
+        "latency_ms_p95": round(statistics.quantiles(latencies, n=20)[-1], 3),
+        "all_submitted_s": round(submitted_s, 3),
+        "all_written_s": round(durable_s, 3),
+        "write_commands": counter.count or None,
+        "stored_leaves": stored,
+        "duplicate_leaves": stored - n_employees,
+        "queue_stats": submissions.stats() if submissions else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16,
+                        help="Số session gửi đồng thời")
+    args = parser.parse_args(argv)
+
+    counter = WriteCounter()
+    monitoring.register(counter)  # trước khi tạo MongoClient
+
+    from settings import DB_NAME
+    if DB_NAME == "leave_management":
+        sys.exit("Không chạy benchmark trên DB thật, hãy đặt MONGO_DB_NAME")
+
+    report = {
+        "legacy": run("legacy", args.employees, args.threads, counter),
+        "queue": run("queue", args.employees, args.threads, counter),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report["queue"]["duplicate_leaves"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# benchmarks/datagen.py
+"""
+Sinh dữ liệu giả có seed cố định: nhân viên + yêu cầu nghỉ
+- Phòng ban, loại nghỉ, trường hợp nghỉ lấy đúng theo các lựa chọn trong app.py
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from leave_dates import DATE_FIELDS, DATE_FORMAT, DATETIME_FORMAT
+
+DEPARTMENTS = ["Kinh doanh", "Marketing", "IT", "Editor"]
+
+# loại nghỉ → (trọng số, các trường hợp nghỉ)
+LEAVE_TYPES = {
+    "Nghỉ phép năm": (60, ["Phép năm"]),
+    "Nghỉ không hưởng lương": (15, ["Do hết phép năm", "Do việc cá nhân thời gian dài"]),
+    "Nghỉ hưởng BHXH": (15, [
+        "Bản thân ốm", "Con ốm", "Bản thân ốm dài ngày",
+        "Chế độ thai sản cho nữ", "Chế độ thai sản cho nam",
+        "Dưỡng sức (sau phẫu thuật, sau sinh, sau ốm, ...)",
+        "Suy giảm khả năng lao động (15% - trên 51%)"
+    ]),
+    "Nghỉ việc riêng có hưởng lương": (10, [
+        "Bản thân kết hôn", "Con kết hôn",
+        "Tang chế tư thân phụ mẫu (Bố/mẹ - vợ/chồng, con chết)"
+    ]),
+}
+
+# Phần lớn yêu cầu cũ đã được xử lý, chỉ một phần nhỏ còn chờ
+STATUS_WEIGHTS = {"approved": 75, "rejected": 10, "pending": 15}
+
+LAST_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Vũ", "Đặng", "Bùi"]
+MIDDLE_NAMES = ["Văn", "Thị", "Minh", "Thu", "Quang", "Ngọc", "Đức", "Hải"]
+FIRST_NAMES = ["An", "Bình", "Chi", "Dũng", "Giang", "Hà", "Khoa", "Linh",
+               "Mai", "Nam", "Phúc", "Quân", "Sơn", "Trang", "Tuấn", "Vy"]
+
+
+def make_employees(n, seed=42):
+    rng = random.Random(seed)
+    employees = []
+    for i in range(n):
+        name = f"{rng.choice(LAST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(FIRST_NAMES)} {i:05d}"
+        employees.append({
+            "full_name": name,
+            "department": rng.choice(DEPARTMENTS),
+            "position": "Nhân viên",
+            "dob": f"{rng.randint(1975, 2002)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "phone": f"09{rng.randint(0, 99999999):08d}",
+            "remaining_days": 12.0,
+        })
+    return employees
+
+
+def make_leaves(m, employees, seed=42, start=date(2024, 1, 1), end=date(2025, 12, 31),
+                date_format="datetime"):
+    """date_format: "datetime" (kiểu lưu hiện tại) hoặc "string" (dữ liệu cũ chưa migrate)"""
+    rng = random.Random(seed + 1)
+    types = list(LEAVE_TYPES)
+    type_weights = [LEAVE_TYPES[t][0] for t in types]
+    statuses = list(STATUS_WEIGHTS)
+    status_weights = list(STATUS_WEIGHTS.values())
+    span = (end - start).days
+
+    leaves = []
+    for _ in range(m):
+        emp = rng.choice(employees)
+        leave_type = rng.choices(types, type_weights)[0]
+        duration = rng.choice([0.5, 1.0, 1.0, 1.0, 2.0, 3.0, 5.0])
+        start_date = start + timedelta(days=rng.randint(0, span))
+        end_date = start_date + timedelta(days=max(int(duration) - 1, 0))
+        requested_at = datetime.combine(start_date, datetime.min.time()) - timedelta(
+            days=rng.randint(1, 14), seconds=rng.randint(0, 86399))
+        requested_at = requested_at.replace(microsecond=0)
+        approved_at = requested_at + timedelta(days=1)
+        status = rng.choices(statuses, status_weights)[0]
+        leaves.append({
+            "full_name": emp["full_name"],
+            "department": emp["department"],
+            "start_date": datetime.combine(start_date, datetime.min.time()),
+            "end_date": datetime.combine(end_date, datetime.min.time()),
+            "duration": duration,
+            "reason": "Benchmark",
+            "leave_type": leave_type,
+            "leave_case": rng.choice(LEAVE_TYPES[leave_type][1]),
+            "status": status,
+            "requested_at": requested_at,
+            "approved_by": None if status == "pending" else "hr_bench",
+            "approved_at": None if status == "pending" else approved_at,
+        })
+
+    if date_format == "string":
+        for leave in leaves:
+            for field in DATE_FIELDS:
+                if leave[field] is not None:
+                    fmt = DATE_FORMAT if field.endswith("_date") else DATETIME_FORMAT
+                    leave[field] = leave[field].strftime(fmt)
+    return leaves
@@ -0,0 +1,254 @@
+# dashboard_data.py
+"""
+Dữ liệu cho tab "Dashboard nhân viên"
+- backend "aggregate": MongoDB $facet/$group, chỉ kéo kết quả tổng hợp về
+- backend "summary": đọc từ bảng tổng hợp leave_summary (chi phí không đổi theo lịch sử)
+- backend "pandas": cách cũ, kéo toàn bộ leaves về rồi groupby (để so sánh)
+- backend "parquet": groupby trên bản xuất Parquet (parquet_export.py), không truy vấn MongoDB;
+  chưa xuất lần nào thì dùng "summary"
+- load_absence_calendar(): số người nghỉ theo ngày × phòng ban (lịch nghỉ / heatmap)
+pandas chỉ được import khi tab dashboard thật sự cần (tab "Yêu cầu" không phải chờ)
+"""
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from settings import ANALYTICS_LEAVES_COL as LEAVES_COL  # đọc qua client phân tích
+from settings import LEAVES_COL as PRIMARY_LEAVES_COL  # dữ liệu cache theo data_version
+from leave_summary import load_summary_totals
+from leave_dates import month_expr, format_date, DATE_FORMAT
+
+DASHBOARD_BACKENDS = ("summary", "aggregate", "pandas", "parquet")
+DETAIL_COLUMNS = ["full_name", "department", "leave_type",
+                  "start_date", "end_date", "duration", "status"]
+DETAIL_LIMIT = 1000  # số dòng tối đa của bảng chi tiết (mới nhất trước)
+
+# duration có thể bị nhập sai kiểu qua tab Sheets → ép về số, lỗi thì tính 0
+_DURATION = {"$convert": {"input": "$duration",
+                          "to": "double", "onError": 0, "onNull": 0}}
+
+
+def _leave_dashboard_pandas():
+    """Cách cũ: groupby trên toàn bộ dữ liệu nghỉ phép"""
+    import pandas as pd
+
+    all_leaves = list(LEAVES_COL.find())
+    if not all_leaves:
+        return None
+
+    return _summarize_frame(pd.DataFrame(all_leaves))
+
+
+def _summarize_frame(df, detail=None):
+    """groupby trên DataFrame leaves đầy đủ; detail mặc định là toàn bộ df"""
+    import pandas as pd
+
+    df["year_month"] = (
+        pd.to_datetime(df["start_date"], errors="coerce")
+        .dt.to_period("M")
+        .astype(str)
+    )
+
+    dept_summary = df.groupby("department")["duration"].sum().reset_index()
+    status_summary = df["status"].value_counts().reset_index()
+    status_summary.columns = ["status", "count"]
+    monthly = df.groupby("year_month")["duration"].sum().reset_index()
+
+    detail = df if detail is None else detail
+    return {
+        "dept_summary": dept_summary,
+        "status_summary": status_summary,
+        "monthly": monthly,
+        "detail": _format_detail(detail.reindex(columns=DETAIL_COLUMNS)),
+    }
+
+
+def _leave_dashboard_parquet():
+    """groupby trên bản xuất Parquet (memory map), bảng chi tiết lấy N dòng mới nhất"""
+    from parquet_export import read_leaves_snapshot
+
+    df = read_leaves_snapshot(columns=[*DETAIL_COLUMNS, "requested_at"])
+    if df is None:
+        return _leave_dashboard_summary()
+    if df.empty:
+        return None
+    detail = df.sort_values(["requested_at", "_id"], ascending=False,
+                            na_position="last").head(DETAIL_LIMIT)
+    return _summarize_frame(df, detail)
+
+
+def _leave_dashboard_aggregate():
+    """Tính cả 3 bảng tổng hợp + bảng chi tiết trong một lệnh $facet"""
+    pipeline = [
+        {"$facet": {
+            "dept_summary": [
+                {"$group": {"_id": "$department", "duration": {"$sum": _DURATION}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "status_summary": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+            ],
+            "monthly": [
+                {"$group": {
+                    "_id": month_expr("$start_date"),
+                    "duration": {"$sum": _DURATION},
+                }},
+                {"$sort": {"_id": 1}},
+            ],
+            "detail": [
+                {"$sort": {"requested_at": -1, "_id": -1}},
+                {"$limit": DETAIL_LIMIT},
+                {"$project": {"_id": 0, **{c: 1 for c in DETAIL_COLUMNS}}},
+            ],
+        }}
+    ]
+    result = next(LEAVES_COL.aggregate(pipeline), None)
+    if not result or not result["status_summary"]:
+        return None
+    return _to_frames(result)
+
+
+def _to_frames(result):
+    """Kết quả aggregation (list dict) → các DataFrame cho biểu đồ"""
+    import pandas as pd
+
+    dept_summary = pd.DataFrame(result["dept_summary"], columns=["_id", "duration"]).rename(
+        columns={"_id": "department"})
+    status_summary = pd.DataFrame(result["status_summary"], columns=["_id", "count"]).rename(
+        columns={"_id": "status"})
+    monthly = pd.DataFrame(result["monthly"], columns=["_id", "duration"]).rename(
+        columns={"_id": "year_month"})
+
+    return {
+        "dept_summary": dept_summary,
+        "status_summary": status_summary,
+        "monthly": monthly,
+        "detail": _format_detail(pd.DataFrame(result["detail"]).reindex(columns=DETAIL_COLUMNS)),
+    }
+
+
+def _format_detail(detail):
+    """Ngày cũ (chuỗi) và mới (datetime) lẫn nhau → đưa về chuỗi để hiển thị"""
+    for col in ("start_date", "end_date"):
+        detail[col] = detail[col].map(format_date)
+    return detail
+
+
+def _leave_dashboard_summary():
+    """Đọc 3 bảng tổng hợp từ leave_summary, bảng chi tiết lấy N dòng mới nhất"""
+    result = load_summary_totals()
+    if not result or not result["status_summary"]:
+        return None
+
+    detail = LEAVES_COL.find({}, {"_id": 0, **{c: 1 for c in DETAIL_COLUMNS}}).sort(
+        [("requested_at", -1), ("_id", -1)]).limit(DETAIL_LIMIT)
+    result["detail"] = list(detail)
+    return _to_frames(result)
+
+
+def load_leave_dashboard(backend="summary"):
+    """
+    Trả về dict các DataFrame: dept_summary, status_summary, monthly, detail
+    - None nếu chưa có dữ liệu nghỉ phép
+    """
+    if backend == "pandas":
+        return _leave_dashboard_pandas()
+    if backend == "aggregate":
+        return _leave_dashboard_aggregate()
+    if backend == "parquet":
+        return _leave_dashboard_parquet()
+    return _leave_dashboard_summary()
+
+
+# ===============================
+# LỊCH NGHỈ THEO NGÀY × PHÒNG BAN
+# ===============================
+CALENDAR_STATUSES = ("approved", "pending")
+CALENDAR_MAX_DAYS = 366
+
+
+def fetch_calendar_leaves(start, end, statuses=CALENDAR_STATUSES):
+    """
+    Các yêu cầu có ngày nghỉ giao với [start, end]
+    - DataFrame full_name, department, start_date, end_date (datetime64)
+    - Dữ liệu chưa migrate (chuỗi "YYYY-MM-DD") so sánh được theo thứ tự chuỗi
+    - Đọc từ primary: kết quả được cache theo data_version (đọc trên primary), đọc từ secondary
+      bị trễ sẽ ghim dữ liệu cũ dưới version mới
+    """
+    import pandas as pd
+
+    start_dt = datetime(start.year, start.month, start.day)
+    end_dt = datetime(end.year, end.month, end.day) + timedelta(days=1)
+    query = {
+        "status": {"$in": list(statuses)},
+        "$or": [
+            {"start_date": {"$lt": end_dt}, "end_date": {"$gte": start_dt}},
+            {"start_date": {"$lt": (end_dt).strftime(DATE_FORMAT)},
+             "end_date": {"$gte": start_dt.strftime(DATE_FORMAT)}},
+        ],
+    }
+    projection = {"_id": 0, "full_name": 1, "department": 1, "start_date": 1, "end_date": 1}
+    df = pd.DataFrame(list(PRIMARY_LEAVES_COL.find(query, projection)),
+                      columns=["full_name", "department", "start_date", "end_date"])
+    for col in ("start_date", "end_date"):
+        df[col] = pd.to_datetime(df[col], errors="coerce").dt.normalize()
+    return df
+
+
+def absence_matrix(leaves, start, end):
+    """
+    Trải các khoảng start_date → end_date thành ngày (không lặp Python theo từng dòng)
+    - Mỗi người chỉ tính một lần mỗi ngày dù có nhiều yêu cầu chồng nhau
+    - Trả về DataFrame: index = ngày, cột = phòng ban, giá trị = số người nghỉ
+    """
+    import numpy as np
+    import pandas as pd
+
+    days = pd.date_range(start, end, freq="D")
+    n_days = len(days)
+    if leaves.empty:
+        return pd.DataFrame(index=days)
+
+    origin = np.datetime64(days[0], "D")
+    first = (leaves["start_date"].values.astype("datetime64[D]") - origin).astype(np.int64)
+    last = leaves["end_date"].values.astype("datetime64[D]")
+    last = np.where(np.isnat(last), leaves["start_date"].values.astype("datetime64[D]"), last)
+    last = (last - origin).astype(np.int64)
+
+    valid = ~np.isnat(leaves["start_date"].values)
+    first, last = np.clip(first, 0, None), np.clip(last, None, n_days - 1)
+    lengths = np.where(valid, last - first + 1, 0).clip(min=0)
+
+    dept_codes, departments = pd.factorize(leaves["department"].fillna(""))
+    person_codes, people = pd.factorize(leaves["full_name"].fillna(""))
+    total = int(lengths.sum())
+    if total == 0:
+        return pd.DataFrame(0, index=days, columns=departments)
+
+    # Ngày thứ k của dòng i = first[i] + (k - vị trí bắt đầu của dòng i trong mảng trải phẳng)
+    row = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    day_idx = first[row] + offsets
+
+    # Khử trùng (phòng ban, người, ngày) rồi đếm theo (phòng ban, ngày)
+    key = (dept_codes[row].astype(np.int64) * len(people) + person_codes[row]) * n_days + day_idx
+    key.sort()
+    key = key[np.r_[True, key[1:] != key[:-1]]]
+    dept_of_key = key // (len(people) * n_days)
+    day_of_key = key % n_days
+    counts = np.bincount(dept_of_key * n_days + day_of_key,
+                         minlength=len(departments) * n_days)
+    return pd.DataFrame(counts.reshape(len(departments), n_days).T,
+                        index=days, columns=departments)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def load_absence_calendar(start, end, statuses=CALENDAR_STATUSES, data_version=None):
+    """
+    Số người nghỉ theo ngày × phòng ban trong [start, end]
+    - data_version: versioning.get_data_version("leaves"), chỉ dùng làm khóa cache
+    """
+    if (end - start).days + 1 > CALENDAR_MAX_DAYS:
+        end = start + timedelta(days=CALENDAR_MAX_DAYS - 1)
+    return absence_matrix(fetch_calendar_leaves(start, end, statuses), start, end)
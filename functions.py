@@ -1,38 +1,120 @@
 # functions.py
 from settings import USERS_COL
 import streamlit as st
+import re
 from datetime import datetime
 from bson import ObjectId
-import time
-from settings import LEAVES_COL, USERS_COL, STATUS_COLORS, EMPLOYEES_COL, db
-import pandas as pd
+from pymongo import InsertOne, UpdateOne, DeleteOne, ReturnDocument
+from settings import LEAVES_COL, USERS_COL, STATUS_COLORS, LEAVE_SUMMARY_COL, db, analytics_db
+from versioning import bump_data_version, new_version, VERSION_FIELD
+from leave_summary import move_status_ops, schedule_leave_summary_rebuild
+from roster import invalidate_roster
+from leave_intervals import index_status_change, invalidate_intervals
+from balance_ledger import deduct_balances
+from submission_queue import (get_submission_queue, make_idempotency_key, IDEMPOTENCY_FIELD,
+                              WAIT_SECONDS, WRITTEN, DUPLICATE, FAILED, QUEUED)
+from rate_limit import get_submit_limiter, get_login_limiter, client_id
+from leave_dates import to_datetime, period_range
+from workdays import validate_duration, load_holidays
 import io
+import tempfile
 # ===============================
 # LEAVE MANAGEMENT FUNCTIONS
 # ===============================
 
 
-def send_leave_request(full_name, department, start_date, end_date, duration, reason, leave_type, leave_case):
-    """Lưu yêu cầu nghỉ mới vào MongoDB"""
-    start_str = start_date.strftime(
-        "%Y-%m-%d") if not isinstance(start_date, str) else start_date
-    end_str = end_date.strftime(
-        "%Y-%m-%d") if not isinstance(end_date, str) else end_date
+SUBMISSION_MESSAGES = {
+    WRITTEN: ("success", "✅ Yêu cầu đã được gửi!"),
+    DUPLICATE: ("warning", "⚠️ Yêu cầu này đã được gửi trước đó và đang chờ duyệt."),
+    FAILED: ("error", "❌ Chưa lưu được yêu cầu, vui lòng gửi lại sau ít phút."),
+}
 
-    LEAVES_COL.insert_one({
+
+def send_leave_request(full_name, department, start_date, end_date, duration, reason, leave_type, leave_case,
+                       idempotency_key=None):
+    """
+    Gửi yêu cầu nghỉ mới (ghi xuống MongoDB bằng hàng đợi nền, chờ tối đa SUBMIT_WAIT_MS)
+    - Trả về True khi yêu cầu đã được ghi xuống DB
+    - Hàng đợi chưa ghi xong → báo đang lưu, khóa vào session_state["pending_submissions"],
+      kết quả hiện sau bằng poll_pending_submissions(); trả về False
+    - duration phải khớp số ngày làm việc giữa start_date và end_date, sai → báo lỗi, trả về False
+    - idempotency_key: cùng khóa đã được gửi (bấm 2 lần, nhiều tab) → cảnh báo, trả về False
+    - Gửi quá nhiều lần (theo nhân viên / theo client, mọi session) → báo chờ, trả về False
+    """
+    st.session_state["submission_messages"] = []  # kết quả của lần gửi trước
+    valid, result = validate_duration(start_date, end_date, duration)
+    if not valid:
+        st.error(f"❌ {result}")
+        return False
+
+    limit_keys = (("employee", full_name), ("client", client_id()))
+    allowed, wait = get_submit_limiter().check(*limit_keys)
+    if not allowed:
+        st.info(f"⏳ Gửi quá nhiều lần, vui lòng chờ {int(wait) + 1} giây rồi thử lại.")
+        return False
+
+    leave = {
         "full_name": full_name,
         "department": department,
-        "start_date": start_str,
-        "end_date": end_str,
+        "start_date": to_datetime(start_date),
+        "end_date": to_datetime(end_date),
         "duration": duration,
         "reason": reason,
         "leave_type": leave_type,
         "leave_case": leave_case,
         "status": "pending",
-        "requested_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "requested_at": datetime.utcnow().replace(microsecond=0),
         "approved_by": None,
-        "approved_at": None
-    })
+        "approved_at": None,
+        IDEMPOTENCY_FIELD: idempotency_key or make_idempotency_key(
+            full_name, start_date, end_date, leave_type, leave_case),
+        VERSION_FIELD: new_version()
+    }
+    submissions = get_submission_queue()
+    key = leave[IDEMPOTENCY_FIELD]
+    try:
+        status = submissions.submit(leave)
+    except OSError:  # không ghi được file spool
+        status = FAILED
+    if status == QUEUED:
+        status = submissions.wait(key, WAIT_SECONDS)
+    if status == WRITTEN:
+        return True
+    if status == QUEUED:
+        st.info("⏳ Hệ thống đang lưu yêu cầu, kết quả sẽ hiện ở đây sau vài giây.")
+        st.session_state.setdefault("pending_submissions", []).append(key)
+        return False
+    # Gửi trùng / không ghi được không tính vào giới hạn
+    get_submit_limiter().refund(*limit_keys)
+    kind, text = SUBMISSION_MESSAGES.get(status, SUBMISSION_MESSAGES[FAILED])
+    getattr(st, kind)(text)
+    return False
+
+
+def poll_pending_submissions():
+    """
+    Hỏi lại kết quả các yêu cầu chưa ghi xong lúc gửi (session_state["pending_submissions"])
+    - Kết quả chuyển sang session_state["submission_messages"]; trả về số yêu cầu còn chờ
+    """
+    pending = st.session_state.get("pending_submissions", [])
+    if not pending:
+        return 0
+    submissions = get_submission_queue()
+    waiting = []
+    for key in pending:
+        status = submissions.status(key)
+        if status is None:  # kết quả đã bị đẩy khỏi bộ nhớ → hỏi DB
+            # status "pending": khớp partial unique index, không nhận nhầm yêu cầu cũ cùng nội dung
+            found = LEAVES_COL.find_one(
+                {IDEMPOTENCY_FIELD: key, "status": "pending"}, {"_id": 1})
+            status = WRITTEN if found else FAILED
+        if status == QUEUED:
+            waiting.append(key)
+        else:
+            st.session_state.setdefault("submission_messages", []).append(
+                SUBMISSION_MESSAGES[status])
+    st.session_state["pending_submissions"] = waiting
+    return len(waiting)
 
 
 def view_leaves(status_filter=None):
@@ -43,62 +125,151 @@ def view_leaves(status_filter=None):
     return list(LEAVES_COL.find(query))
 
 
-def approve_leave(leave_id, hr_name):
-    """Duyệt yêu cầu nghỉ"""
-    placeholder = st.empty()
-    with placeholder:
-        st.info("⏳ Đang duyệt...")
-    time.sleep(0.4)
-
-    # Lấy thông tin yêu cầu nghỉ
-    leave = LEAVES_COL.find_one({"_id": ObjectId(leave_id)})
-
-    now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    LEAVES_COL.update_one(
-        {"_id": ObjectId(leave_id)},
-        {"$set": {
-            "status": "approved",
-            "approved_by": hr_name,
-            "approved_at": now_str
-        }}
+def build_leave_query(status_filter=None, search_name=None, department=None, year=None, month=None):
+    """Gộp các bộ lọc của tab HR thành một filter MongoDB"""
+    query = {}
+    if status_filter:
+        query["status"] = status_filter
+    if department:
+        query["department"] = department
+    if search_name:
+        query["full_name"] = {
+            "$regex": re.escape(search_name.strip()), "$options": "i"}
+
+    # start_date: datetime (mới) → lọc theo khoảng, dùng được index
+    #             chuỗi "YYYY-MM-DD" (chưa migrate) → lọc bằng prefix regex
+    if year:
+        start, end = period_range(year, month)
+        prefix = f"^{year}-{month}-" if month else f"^{year}-"
+        query["$or"] = [
+            {"start_date": {"$gte": start, "$lt": end}},
+            {"start_date": {"$regex": prefix}},
+        ]
+    elif month:
+        query["$or"] = [
+            {"start_date": {"$regex": rf"^\d{{4}}-{month}-"}},
+            {"$expr": {"$cond": [
+                {"$eq": [{"$type": "$start_date"}, "date"]},
+                {"$eq": [{"$month": "$start_date"}, int(month)]},
+                False,
+            ]}},
+        ]
+    return query
+
+
+def query_leaves(status_filter=None, search_name=None, department=None, year=None, month=None,
+                 page=1, page_size=20):
+    """
+    Lấy một trang yêu cầu nghỉ theo bộ lọc
+    - Lọc, sắp xếp và phân trang trên MongoDB
+    - Trả về (danh sách của trang, tổng số bản ghi khớp bộ lọc)
+    """
+    query = build_leave_query(
+        status_filter, search_name, department, year, month)
+    total = LEAVES_COL.count_documents(query)
+
+    page = max(int(page), 1)
+    cursor = (
+        LEAVES_COL.find(query)
+        .sort([("requested_at", -1), ("_id", -1)])
+        .skip((page - 1) * page_size)
+        .limit(page_size)
     )
+    return list(cursor), total
 
-    # Nếu là nghỉ phép năm → trừ số ngày phép còn lại
-    if leave and leave.get("leave_type") == "Nghỉ phép năm":
-        emp_name = leave.get("full_name")
-        duration = float(leave.get("duration", 0))
-        EMPLOYEES_COL.update_one(
-            {"full_name": emp_name},
-            {"$inc": {"remaining_days": -duration}}
+
+DECISION_LABELS = {"approved": "✅ Đã duyệt", "rejected": "❌ Đã từ chối"}
+
+
+def _transition_pending(ids, hr_name, decision):
+    """
+    Chuyển pending → decision có điều kiện trên status
+    - Khi nhiều HR bấm cùng lúc chỉ một người chuyển được, người sau nhận 0 bản ghi
+    - Trả về {_id: leave} của các yêu cầu mà lần gọi này đã chuyển thành công
+    """
+    changes = {
+        "status": decision,
+        "approved_by": hr_name,
+        "approved_at": datetime.utcnow().replace(microsecond=0),
+        VERSION_FIELD: new_version()
+    }
+
+    if len(ids) == 1:
+        # Một round trip: vừa kiểm tra, vừa cập nhật, vừa lấy dữ liệu
+        leave = LEAVES_COL.find_one_and_update(
+            {"_id": ids[0], "status": "pending"},
+            {"$set": changes},
+            return_document=ReturnDocument.AFTER,
         )
+        return {leave["_id"]: leave} if leave else {}
+
+    # Nhiều yêu cầu: đánh dấu bằng decision_id riêng của lần gọi này rồi đọc lại
+    decision_id = ObjectId()
+    LEAVES_COL.update_many(
+        {"_id": {"$in": ids}, "status": "pending"},
+        {"$set": {**changes, "decision_id": decision_id}},
+    )
+    decided = {doc["_id"]: doc for doc in LEAVES_COL.find(
+        {"_id": {"$in": ids}, "decision_id": decision_id})}
+    # decision_id chỉ dùng để đọc lại lô này → gỡ đi, không để lại trên document
+    if decided:
+        LEAVES_COL.update_many(
+            {"_id": {"$in": list(decided)}, "decision_id": decision_id},
+            {"$unset": {"decision_id": ""}})
+    for doc in decided.values():
+        doc.pop("decision_id", None)
+    return decided
+
+
+def decide_leaves(leave_ids, hr_name, decision):
+    """
+    Duyệt / từ chối nhiều yêu cầu nghỉ trong một lần
+    - decision: "approved" hoặc "rejected"
+    - Chỉ yêu cầu đang "pending" mới được cập nhật
+    - Trả về list {"_id", "ok", "message"} theo đúng thứ tự leave_ids
+    """
+    if decision not in DECISION_LABELS:
+        raise ValueError(f"Quyết định không hợp lệ: {decision}")
+
+    ids = [ObjectId(str(i)) for i in leave_ids]
+    decided = _transition_pending(ids, hr_name, decision)
+
+    if decided:
+        summary_ops = []
+        for leave in decided.values():
+            summary_ops.extend(move_status_ops(leave, "pending", decision))
+        LEAVE_SUMMARY_COL.bulk_write(summary_ops, ordered=False)
+        index_status_change(list(decided), decision)
+
+        # Nghỉ phép năm được duyệt → trừ phép qua sổ trừ phép (xem balance_ledger.py)
+        if decision == "approved" and deduct_balances(decided.values()):
+            invalidate_roster()
+            bump_data_version("employees")
+        bump_data_version("leaves")
+
+    results = []
+    for _id in ids:
+        if _id in decided:
+            results.append(
+                {"_id": str(_id), "ok": True, "message": DECISION_LABELS[decision]})
+        else:
+            results.append(
+                {"_id": str(_id), "ok": False, "message": "Không còn ở trạng thái chờ duyệt"})
+    return results
 
-    placeholder.success("✅ Đã duyệt !")
-    time.sleep(1)
-    placeholder.empty()
-    st.rerun()
+
+def approve_leave(leave_id, hr_name):
+    """Duyệt yêu cầu nghỉ"""
+    result = decide_leaves([leave_id], hr_name, "approved")[0]
+    st.toast(result["message"])
+    return result
 
 
 def reject_leave(leave_id, hr_name):
     """Từ chối yêu cầu nghỉ"""
-    placeholder = st.empty()
-    with placeholder:
-        st.info("🚫 Đang từ chối...")
-    time.sleep(0.4)
-
-    now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    LEAVES_COL.update_one(
-        {"_id": ObjectId(leave_id)},
-        {"$set": {
-            "status": "rejected",
-            "approved_by": hr_name,
-            "approved_at": now_str
-        }}
-    )
-
-    placeholder.error("❌ Đã từ chối!")
-    time.sleep(1)
-    placeholder.empty()
-    st.rerun()
+    result = decide_leaves([leave_id], hr_name, "rejected")[0]
+    st.toast(result["message"])
+    return result
 
 
 def status_badge(status: str):
@@ -107,6 +278,15 @@ def status_badge(status: str):
 
 def check_admin_login(username_input, password_input):
     """Kiểm tra thông tin đăng nhập HR trong database"""
+    # Chặn dò mật khẩu trước khi chạm tới MongoDB
+    client = client_id()
+    limit_keys = (("user_client", (username_input, client)), ("username", username_input),
+                  ("client", client))
+    allowed, wait = get_login_limiter().check(*limit_keys)
+    if not allowed:
+        st.error(f"⛔ Đăng nhập sai quá nhiều lần, vui lòng chờ {int(wait) + 1} giây.")
+        return False
+
     user = USERS_COL.find_one({"username": username_input})
     if not user:
         st.error("❌ Không tìm thấy tài khoản trong database.")
@@ -115,6 +295,8 @@ def check_admin_login(username_input, password_input):
         st.error("❌ Sai mật khẩu.")
         return False
 
+    # Đăng nhập đúng không tính vào giới hạn (nhiều HR dùng chung IP văn phòng)
+    get_login_limiter().refund(*limit_keys)
     st.session_state["hr_logged_in"] = True
     st.session_state["hr_username"] = username_input
     st.session_state["admin_name"] = user.get("full_name", "Admin")
@@ -127,57 +309,257 @@ def get_collections():
     return db.list_collection_names()
 
 
-def load_collection(col_name):
-    """Load dữ liệu collection ra DataFrame"""
+@st.cache_data(show_spinner=False, ttl=60)
+def collection_metadata(col_name, sample_size=200):
+    """
+    Thông tin nhanh của collection (cache 60s)
+    - count: estimated_document_count (đọc metadata, không quét collection)
+    - fields: các cột lấy mẫu từ sample_size document, cột hay gặp trước
+    """
+    col = analytics_db[col_name]
+    fields = col.aggregate([
+        {"$sample": {"size": sample_size}},
+        {"$project": {"kv": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$kv"},
+        {"$group": {"_id": "$kv.k", "n": {"$sum": 1}}},
+        {"$sort": {"n": -1, "_id": 1}},
+    ])
+    return {
+        "count": col.estimated_document_count(),
+        # Trường hệ thống (_id, _version, sổ trừ phép, ...) không cho chọn
+        "fields": [f["_id"] for f in fields if not f["_id"].startswith("_")],
+    }
+
+
+def load_collection(col_name, fields=None, skip=0, limit=None):
+    """
+    Load dữ liệu collection ra DataFrame
+    - fields: chỉ lấy các cột này (projection trên MongoDB), _id luôn có
+    - skip/limit: lấy một trang, sắp xếp theo _id để các trang ổn định
+    - Đọc từ primary: _version của bản này dùng để phát hiện xung đột khi lưu, đọc từ secondary
+      bị trễ sẽ báo xung đột giả và hiển thị lại giá trị cũ ngay sau khi lưu
+    """
+    import pandas as pd
+
     col = db[col_name]
-    data = list(col.find({}))
+    projection = {VERSION_FIELD: 1, **{f: 1 for f in fields}} if fields else None
+    cursor = col.find({}, projection)
+    if skip or limit:
+        cursor = cursor.sort("_id", 1).skip(skip).limit(limit or 0)
+    data = list(cursor)
     if not data:
-        return pd.DataFrame()
+        return pd.DataFrame(columns=["_id", VERSION_FIELD, *(fields or [])])
     df = pd.DataFrame(data)
     df["_id"] = df["_id"].astype(str)  # chuyển ObjectId về string để hiển thị
+    if fields:
+        # Cột không có trong trang này vẫn hiển thị (trống) để HR nhập được
+        df = df.reindex(columns=["_id", VERSION_FIELD, *fields])
     return df
 
 
-def save_dataframe(col_name, df):
+def _to_object_id(value):
+    """Chuyển _id dạng string về ObjectId nếu hợp lệ"""
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def _is_missing(value):
+    """None / NaN / chuỗi rỗng đều coi là ô trống"""
+    if isinstance(value, (list, dict)):
+        return False
+    if isinstance(value, str):
+        return value.strip() in ("", "None", "nan")
+    import pandas as pd
+    try:
+        return bool(pd.isnull(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _same_value(old, new):
+    if _is_missing(old) and _is_missing(new):
+        return True
+    if _is_missing(old) or _is_missing(new):
+        return False
+    try:
+        return bool(old == new)
+    except (TypeError, ValueError):
+        return False
+
+
+def diff_dataframe(original_df, edited_df):
+    """
+    So sánh DataFrame đã sửa với bản gốc đã load
+    - Trả về (inserts, updates, deletes)
+    - updates: list (_id, {field: value mới}, [field bị xóa trống], _version lúc load)
+    - deletes: list (_id, _version lúc load)
+    """
+    original_rows = {}
+    if original_df is not None and not original_df.empty and "_id" in original_df.columns:
+        for rec in original_df.to_dict("records"):
+            original_rows[str(rec["_id"])] = rec
+
+    inserts, updates = [], []
+    seen_ids = set()
+    for rec in edited_df.to_dict("records"):
+        row_id = rec.get("_id")
+        fields = {k: v for k, v in rec.items() if k not in (
+            "_id", VERSION_FIELD)}
+
+        if _is_missing(row_id) or str(row_id) not in original_rows:
+            # Dòng mới thêm trên UI
+            data = {k: v for k, v in fields.items() if not _is_missing(v)}
+            if data:
+                inserts.append(data)
+            continue
+
+        row_id = str(row_id)
+        seen_ids.add(row_id)
+        old = original_rows[row_id]
+        changed, cleared = {}, []
+        for k, v in fields.items():
+            if _same_value(old.get(k), v):
+                continue
+            if _is_missing(v):
+                cleared.append(k)
+            else:
+                changed[k] = v
+        if changed or cleared:
+            updates.append((row_id, changed, cleared, old.get(VERSION_FIELD)))
+
+    deletes = [(i, rec.get(VERSION_FIELD))
+               for i, rec in original_rows.items() if i not in seen_ids]
+    return inserts, updates, deletes
+
+
+def _version_filter(row_id, version):
+    """Điều kiện: document vẫn đúng phiên bản lúc load (chưa ai sửa)"""
+    if _is_missing(version):
+        # Document cũ chưa có _version
+        return {"_id": _to_object_id(row_id), VERSION_FIELD: {"$exists": False}}
+    return {"_id": _to_object_id(row_id), VERSION_FIELD: str(version)}
+
+
+def save_dataframe(col_name, df, original_df=None, batch_size=1000):
     """
     Lưu DataFrame vào MongoDB
-    - Dùng _id để quyết định update vs insert
-    - Xóa những dòng bị xóa ở UI
+    - So sánh với bản gốc đã load (original_df), chỉ gửi các ô thay đổi
+    - Mỗi update/delete có điều kiện trên _version lúc load (optimistic concurrency):
+      dòng đã bị người khác sửa/xóa sẽ không bị ghi đè mà trả về trong "conflicts"
+    - Gửi bằng bulk_write không thứ tự, theo từng batch
+    - Trả về số dòng đã insert/update/delete và danh sách _id bị xung đột
     """
     col = db[col_name]
 
-    # 1️⃣ Lấy danh sách _id cũ
-    old_ids = set([str(doc["_id"]) for doc in col.find({}, {"_id": 1})])
-
-    # 2️⃣ Lấy danh sách _id hiện có trong DataFrame
-    if "_id" in df.columns:
-        df["_id"] = df["_id"].astype(str)
-        new_ids = set(df["_id"].dropna().tolist())
-    else:
-        df["_id"] = None
-        new_ids = set()
-
-    # 3️⃣ Xóa những dòng bị xóa trên UI
-    ids_to_delete = old_ids - new_ids
-    if ids_to_delete:
-        col.delete_many({"_id": {"$in": [ObjectId(i) for i in ids_to_delete]}})
-
-    # 4️⃣ Insert/Update từng dòng
-    for _, row in df.iterrows():
-        data = {k: v for k, v in row.to_dict().items() if pd.notnull(v)
-                and k != "_id"}
-
-        if row["_id"] and row["_id"].strip() != "None":
-            # Update dòng cũ
-            col.update_one({"_id": ObjectId(row["_id"])}, {"$set": data})
-        else:
-            # Insert dòng mới
-            col.insert_one(data)
+    # Không có bản gốc → load _id + dữ liệu hiện tại trên DB để so sánh
+    if original_df is None:
+        original_df = load_collection(col_name)
+
+    inserts, updates, deletes = diff_dataframe(original_df, df)
+    version = new_version()  # mọi dòng ghi thành công trong lần lưu này mang version này
+
+    ops = [InsertOne({**data, VERSION_FIELD: version}) for data in inserts]
+    for row_id, changed, cleared, old_version in updates:
+        update = {"$set": {**changed, VERSION_FIELD: version}}
+        if cleared:
+            update["$unset"] = {k: "" for k in cleared}
+        ops.append(UpdateOne(_version_filter(row_id, old_version), update))
+    ops.extend(DeleteOne(_version_filter(i, old_version))
+               for i, old_version in deletes)
+
+    stats = {"inserted": 0, "updated": 0, "deleted": 0}
+    matched = deleted = 0
+    for i in range(0, len(ops), batch_size):
+        result = col.bulk_write(ops[i:i + batch_size], ordered=False)
+        stats["inserted"] += result.inserted_count
+        stats["updated"] += result.modified_count
+        stats["deleted"] += result.deleted_count
+        matched += result.matched_count
+        deleted += result.deleted_count
+
+    # Chỉ truy vấn lại khi số dòng khớp ít hơn số lệnh → có xung đột
+    conflicts = []
+    if matched < len(updates):
+        ids = [_to_object_id(u[0]) for u in updates]
+        conflicts += [str(d["_id"]) for d in col.find(
+            {"_id": {"$in": ids}, VERSION_FIELD: {"$ne": version}}, {"_id": 1})]
+        # Dòng đã bị người khác xóa
+        found = {str(d["_id"]) for d in col.find(
+            {"_id": {"$in": ids}}, {"_id": 1})}
+        conflicts += [u[0] for u in updates if u[0] not in found]
+    if deleted < len(deletes):
+        conflicts += [str(d["_id"]) for d in col.find(
+            {"_id": {"$in": [_to_object_id(i) for i, _ in deletes]}}, {"_id": 1})]
+    stats["conflicts"] = conflicts
+
+    if ops:
+        if col_name == "employees":
+            invalidate_roster()
+        if col_name == "leaves":
+            # Sửa tay không đi qua $inc của bảng tổng hợp → tính lại để dashboard "summary" khớp
+            schedule_leave_summary_rebuild()
+            invalidate_intervals()
+        if col_name == "holidays":
+            load_holidays.clear()
+        bump_data_version(col_name)
+    return stats
 
 
 def to_excel(df):
     """Xuất DataFrame ra Excel"""
+    import pandas as pd
+
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         df.to_excel(writer, index=False, sheet_name='Sheet1')
     return output.getvalue()
+
+
+def _excel_value(value):
+    """Chuyển giá trị Mongo về kiểu xlsxwriter ghi được"""
+    if value is None or isinstance(value, (str, int, float, bool, datetime)):
+        return value
+    return str(value)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def export_collection_excel(col_name, data_version=None, batch_size=1000):
+    """
+    Xuất collection ra Excel theo kiểu streaming
+    - Đọc cursor theo từng batch, xlsxwriter constant_memory ghi từng dòng ra file tạm
+    - Cache theo (collection, data_version): dữ liệu không đổi thì không encode lại
+    - Đọc từ primary: version đọc trên primary, secondary bị trễ sẽ ghim dữ liệu cũ vào cache
+      dưới version mới cho tới lần ghi sau
+    """
+    import xlsxwriter
+
+    col = db[col_name]
+    first = col.find_one({})
+    if first is None:
+        return b""
+
+    # constant_memory chỉ ghi tuần tự → phải biết đủ cột trước khi ghi header
+    all_fields = col.aggregate([
+        {"$project": {"kv": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$kv"},
+        {"$group": {"_id": "$kv.k"}},
+    ])
+    fields = list(first.keys())
+    fields += sorted(f["_id"] for f in all_fields if f["_id"] not in first)
+
+    with tempfile.TemporaryFile() as tmp:
+        workbook = xlsxwriter.Workbook(tmp, {
+            "constant_memory": True,
+            "nan_inf_to_errors": True,
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        })
+        sheet = workbook.add_worksheet("Sheet1")
+        sheet.write_row(0, 0, fields)
+
+        cursor = col.find({}, batch_size=batch_size)
+        for row, doc in enumerate(cursor, start=1):
+            sheet.write_row(row, 0, [_excel_value(doc.get(f))
+                            for f in fields])
+        workbook.close()
+
+        tmp.seek(0)
+        return tmp.read()
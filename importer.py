@@ -0,0 +1,229 @@
+# importer.py
+"""
+Import file CSV / Excel vào một collection
+- Đọc file theo từng chunk (không load cả file vào bộ nhớ)
+- Ép kiểu từng chunk theo COLUMN_TYPES, dòng/ô lỗi được ghi vào báo cáo thay vì dừng cả file
+- Upsert theo cột khóa bằng bulk_write không thứ tự
+- Cột khóa: _id (mặc định, dòng không có _id được thêm mới) hoặc cột đã có index (indexes.py);
+  cột không unique được kiểm tra bằng $group: khóa khớp nhiều document → bỏ dòng, báo lỗi
+- Cột hệ thống (bắt đầu bằng "_", vd. _version trong file Excel đã xuất) không được ghi đè
+"""
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+
+from settings import db
+from versioning import bump_data_version, new_version, VERSION_FIELD
+
+CHUNK_SIZE = 5000
+MAX_ERRORS = 1000  # giữ tối đa bao nhiêu lỗi trong báo cáo
+
+# Kiểu dữ liệu của các cột đã biết: "float", "datetime", "str"
+COLUMN_TYPES = {
+    "employees": {
+        "full_name": "str",
+        "department": "str",
+        "position": "str",
+        "phone": "str",
+        "remaining_days": "float",
+    },
+    "leaves": {
+        "full_name": "str",
+        "department": "str",
+        "duration": "float",
+        "start_date": "datetime",
+        "end_date": "datetime",
+        "requested_at": "datetime",
+        "approved_at": "datetime",
+    },
+}
+
+
+def _read_csv_chunks(file, chunk_size):
+    import pandas as pd
+    # dtype=str: giữ nguyên giá trị gốc (vd. SĐT bắt đầu bằng 0), ép kiểu sau
+    yield from pd.read_csv(file, chunksize=chunk_size, dtype=str, keep_default_na=False)
+
+
+def _read_xlsx_chunks(file, chunk_size):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_chunks(file, filename, chunk_size=CHUNK_SIZE):
+    """Các DataFrame liên tiếp của file (CSV hoặc XLSX)"""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _read_xlsx_chunks(file, chunk_size)
+    return _read_csv_chunks(file, chunk_size)
+
+
+def coerce_chunk(chunk, column_types, first_row):
+    """
+    Ép kiểu một chunk
+    - Trả về (chunk đã ép kiểu, list lỗi {"row", "column", "value", "error"})
+    - first_row: số thứ tự (trong file) của dòng đầu chunk, để báo lỗi đúng dòng
+    """
+    import pandas as pd
+
+    chunk = chunk.loc[:, [c for c in chunk.columns if c]]  # bỏ cột không có tên
+    errors = []
+    for column, kind in column_types.items():
+        if column not in chunk.columns:
+            continue
+        raw = chunk[column]
+        blank = raw.isna() | (raw.astype(str).str.strip() == "")
+        if kind == "float":
+            # to_numeric trả int64 khi mọi giá trị là số nguyên → ép về float như kiểu khai báo
+            values = pd.to_numeric(raw.astype(str).str.replace(",", ".", regex=False),
+                                   errors="coerce").astype(float).where(~blank)
+        elif kind == "datetime":
+            values = pd.to_datetime(raw.where(~blank), errors="coerce")
+        else:
+            values = raw.where(~blank).astype(object).map(
+                lambda v: v if v is None or v != v else str(v).strip())
+
+        bad = values.isna() & ~blank
+        for idx in chunk.index[bad]:
+            errors.append({"row": first_row + idx, "column": column,
+                           "value": raw[idx], "error": f"không phải {kind}"})
+        chunk[column] = values
+    return chunk, errors
+
+
+def _clean_record(record):
+    """Bỏ ô trống; Timestamp/NaT → datetime/None"""
+    clean = {}
+    for k, v in record.items():
+        if v is None or v != v:  # None / NaN / NaT
+            continue
+        if isinstance(v, str) and not v.strip():
+            continue
+        if hasattr(v, "to_pydatetime"):
+            v = v.to_pydatetime()
+        clean[k] = v
+    return clean
+
+
+def import_key_columns(col_name):
+    """
+    Các cột dùng được làm khóa upsert: {cột: unique}
+    - _id luôn đứng đầu; các cột khác phải đứng đầu một index đã có → mỗi dòng là một lần tra index
+    - unique: có unique index một cột (không partial) → không cần kiểm tra trùng trước khi ghi
+    """
+    keys = {"_id": True}
+    for info in db[col_name].index_information().values():
+        column = info["key"][0][0]
+        if column == "_id":
+            continue
+        unique = (bool(info.get("unique")) and len(info["key"]) == 1
+                  and "partialFilterExpression" not in info)
+        keys[column] = keys.get(column, False) or unique
+    return keys
+
+
+def _ambiguous_keys(col, key_column, keys):
+    """{khóa: số document} của các khóa khớp nhiều hơn một document"""
+    return {d["_id"]: d["n"] for d in col.aggregate([
+        {"$match": {key_column: {"$in": keys}}},
+        {"$group": {"_id": f"${key_column}", "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ])}
+
+
+def import_file(col_name, file, filename, key_column="_id", chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import file vào col_name, upsert theo key_column
+    - key_column phải là một cột trong import_key_columns(col_name), không thì ValueError
+    - progress(số dòng đã xử lý): gọi sau mỗi chunk
+    - Trả về báo cáo {"rows", "inserted", "updated", "skipped", "errors"}
+    """
+    col = db[col_name]
+    key_columns = import_key_columns(col_name)
+    if key_column not in key_columns:
+        raise ValueError(
+            f"Cột '{key_column}' chưa có index nên không dùng làm khóa được, hãy chọn _id "
+            "hoặc một cột có index")
+    unique_key = key_columns[key_column]
+    column_types = COLUMN_TYPES.get(col_name, {})
+
+    report = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "errors": []}
+    for chunk in read_chunks(file, filename, chunk_size):
+        chunk = chunk.reset_index(drop=True)
+        first_row = report["rows"] + 2  # dòng 1 là header
+        report["rows"] += len(chunk)
+
+        if key_column not in chunk.columns and key_column != "_id":
+            raise ValueError(f"File không có cột khóa '{key_column}'")
+
+        chunk, errors = coerce_chunk(chunk, column_types, first_row)
+        error_rows = {e["row"] for e in errors}
+
+        # Trùng khóa trong cùng chunk → giữ dòng sau cùng
+        rows, inserts = {}, []
+        version = new_version()
+        for idx, record in enumerate(chunk.to_dict("records")):
+            row_no = first_row + idx
+            data = _clean_record(record)
+            key = data.pop(key_column, None)
+            data = {k: v for k, v in data.items() if not k.startswith("_")}
+            if row_no in error_rows:
+                report["skipped"] += 1
+                continue
+            if key is None:
+                if key_column == "_id" and data:
+                    inserts.append(InsertOne({**data, VERSION_FIELD: version}))
+                    continue
+                errors.append({"row": row_no, "column": key_column,
+                               "value": None, "error": "thiếu khóa"})
+                report["skipped"] += 1
+                continue
+            if key_column == "_id" and ObjectId.is_valid(str(key)):
+                key = ObjectId(str(key))
+            rows[key] = (row_no, data)
+
+        if rows and not unique_key:
+            # Khóa khớp nhiều document (vd. full_name của leaves) → không biết cập nhật dòng nào
+            for key, count in _ambiguous_keys(col, key_column, list(rows)).items():
+                row_no, _ = rows.pop(key)
+                errors.append({"row": row_no, "column": key_column, "value": key,
+                               "error": f"khóa khớp {count} document"})
+                report["skipped"] += 1
+
+        ops = inserts + [UpdateOne({key_column: key},
+                                   {"$set": {**data, VERSION_FIELD: version}}, upsert=True)
+                         for key, (_, data) in rows.items()]
+        if ops:
+            result = col.bulk_write(ops, ordered=False)
+            report["inserted"] += result.inserted_count + result.upserted_count
+            report["updated"] += result.modified_count
+
+        room = MAX_ERRORS - len(report["errors"])
+        report["errors"].extend(errors[:max(room, 0)])
+        if progress:
+            progress(report["rows"])
+
+    if report["inserted"] or report["updated"]:
+        if col_name == "employees":
+            from roster import invalidate_roster
+            invalidate_roster()
+        if col_name == "leaves":
+            from leave_summary import schedule_leave_summary_rebuild
+            from leave_intervals import invalidate_intervals
+            schedule_leave_summary_rebuild()
+            invalidate_intervals()
+        bump_data_version(col_name)
+    return report
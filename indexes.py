@@ -0,0 +1,176 @@
+# indexes.py
+"""
+Quản lý index cho các collection
+- ensure_indexes(): tạo index (idempotent, chạy lại nhiều lần không sao)
+- verify_indexes(): explain() các truy vấn nóng, phát hiện COLLSCAN
+- bootstrap_indexes(): app gọi sau khi trang đã hiển thị, tạo index + bảng ngày lễ ở luồng nền
+Chạy từ CLI:  python indexes.py [--verify-only]
+"""
+import argparse
+import logging
+import sys
+import threading
+from datetime import datetime
+
+import streamlit as st
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from settings import LEAVES_COL, EMPLOYEES_COL, USERS_COL, BALANCE_LEDGER_COL
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# ĐỊNH NGHĨA INDEX
+# ===============================
+# (collection, keys, options) — tên index cố định để create_index idempotent
+INDEX_SPECS = [
+    # Tab HR: lọc theo trạng thái, sắp xếp theo thời gian gửi
+    (LEAVES_COL, [("status", ASCENDING), ("requested_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "status_requested_at"}),
+    # Tab HR: lọc theo phòng ban (+ trạng thái)
+    (LEAVES_COL, [("department", ASCENDING), ("status", ASCENDING), ("requested_at", DESCENDING)],
+     {"name": "department_status_requested_at"}),
+    # Tab HR: lọc theo năm/tháng (khoảng ngày, hoặc prefix với dữ liệu chưa migrate)
+    (LEAVES_COL, [("start_date", ASCENDING), ("status", ASCENDING)],
+     {"name": "start_date_status"}),
+    # Tab HR: không lọc gì, chỉ sắp xếp
+    (LEAVES_COL, [("requested_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "requested_at"}),
+    # Tab HR: watermark approved_at khi cập nhật tăng dần (leave_feed.py, chế độ polling)
+    (LEAVES_COL, [("approved_at", DESCENDING)],
+     {"name": "approved_at", "sparse": True}),
+    # Chống gửi trùng: mỗi idempotency_key chỉ có một yêu cầu đang chờ duyệt
+    (LEAVES_COL, [("idempotency_key", ASCENDING)],
+     {"name": "idempotency_key_pending", "unique": True,
+      "partialFilterExpression": {"idempotency_key": {"$exists": True}, "status": "pending"}}),
+    # Tra cứu nghỉ phép theo nhân viên
+    (LEAVES_COL, [("full_name", ASCENDING), ("start_date", ASCENDING)],
+     {"name": "full_name_start_date"}),
+    # approve_leave trừ phép theo full_name, danh sách nhân viên theo phòng ban
+    (EMPLOYEES_COL, [("full_name", ASCENDING), ("department", ASCENDING)],
+     {"name": "full_name_department"}),
+    (EMPLOYEES_COL, [("department", ASCENDING)],
+     {"name": "department"}),
+    # reconcile_balances: dòng sổ trừ phép còn dở theo thời gian tạo
+    (BALANCE_LEDGER_COL, [("state", ASCENDING), ("created_at", ASCENDING)],
+     {"name": "state_created_at"}),
+    # check_admin_login
+    (USERS_COL, [("username", ASCENDING)],
+     {"name": "username"}),
+]
+
+# (tên, collection, filter, sort) — các truy vấn nóng trong app.py/functions.py
+HOT_QUERIES = [
+    ("leaves theo status", LEAVES_COL, {"status": "pending"},
+     [("requested_at", DESCENDING), ("_id", DESCENDING)]),
+    ("leaves theo phòng ban", LEAVES_COL, {"department": "IT", "status": "pending"},
+     [("requested_at", DESCENDING)]),
+    ("leaves theo năm/tháng", LEAVES_COL,
+     {"start_date": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 2, 1)}}, None),
+    ("leaves theo năm/tháng (chuỗi cũ)", LEAVES_COL, {"start_date": {"$regex": "^2025-01-"}},
+     None),
+    ("leaves sắp xếp", LEAVES_COL, {},
+     [("requested_at", DESCENDING), ("_id", DESCENDING)]),
+    ("leaves thay đổi từ watermark", LEAVES_COL,
+     {"$or": [{"_id": {"$gt": ObjectId("000000000000000000000000")}},
+              {"approved_at": {"$gte": datetime(2025, 1, 1)}}]}, None),
+    ("leaves theo idempotency_key", LEAVES_COL,
+     {"idempotency_key": "0" * 64, "status": "pending"}, None),
+    ("leaves theo nhân viên", LEAVES_COL, {"full_name": "Nguyễn Văn A"},
+     None),
+    ("employees theo tên", EMPLOYEES_COL, {"full_name": "Nguyễn Văn A"},
+     None),
+    ("admin theo username", USERS_COL, {"username": "admin"},
+     None),
+]
+
+
+def ensure_indexes():
+    """Tạo toàn bộ index còn thiếu, trả về danh sách tên index"""
+    names = []
+    for col, keys, options in INDEX_SPECS:
+        names.append(col.create_index(keys, **options))
+    return names
+
+
+def _plan_stages(plan):
+    """Duyệt cây winningPlan, trả về tên các stage"""
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        for key in ("inputStage", "queryPlan"):
+            if key in node:
+                stack.append(node[key])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+
+def verify_indexes():
+    """
+    explain() từng truy vấn nóng
+    - Trả về list (tên truy vấn, danh sách stage, có COLLSCAN hay không)
+    """
+    results = []
+    for name, col, query, sort in HOT_QUERIES:
+        cursor = col.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(plan)
+        results.append((name, stages, "COLLSCAN" in stages))
+    return results
+
+
+def _bootstrap():
+    """Tạo index (chỉ cảnh báo nếu có COLLSCAN) + chép lịch nghỉ mặc định vào bảng ngày lễ"""
+    from workdays import ensure_holidays
+
+    try:
+        ensure_indexes()
+        for name, stages, collscan in verify_indexes():
+            if collscan:
+                logger.warning(
+                    "Truy vấn '%s' vẫn dùng COLLSCAN: %s", name, stages)
+    except Exception as e:  # không chặn app nếu user DB không có quyền tạo index
+        logger.warning("Không thể khởi tạo index: %s", e)
+    ensure_holidays()
+
+
+@st.cache_resource(show_spinner=False)
+def bootstrap_indexes():
+    """
+    Một lần mỗi process, chạy ở luồng nền (idempotent)
+    - Khoảng 20 lệnh create_index / explain → lần render đầu không phải chờ
+    - Trong lúc chạy: truy vấn vẫn đúng (chỉ chậm hơn), ngày lễ dùng bảng mặc định
+    """
+    threading.Thread(target=_bootstrap, name="bootstrap-indexes", daemon=True).start()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tạo và kiểm tra index MongoDB")
+    parser.add_argument("--verify-only", action="store_true",
+                        help="Chỉ kiểm tra, không tạo index")
+    args = parser.parse_args(argv)
+
+    if not args.verify_only:
+        for name in ensure_indexes():
+            print(f"✅ index {name}")
+
+    failed = False
+    for name, stages, collscan in verify_indexes():
+        mark = "❌ COLLSCAN" if collscan else "✅"
+        print(f"{mark} {name}: {' → '.join(reversed(stages))}")
+        failed = failed or collscan
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# instrumentation.py
+"""
+Đo thời gian cho mỗi lần chạy script (rerun)
+- Bọc Database/Collection của pymongo: mỗi lệnh ghi lại thời gian, số document, số byte
+  (số byte ước lượng: cursor chỉ bson.encode 1 / PERF_BYTES_SAMPLE document rồi nhân lên)
+- perf_block("..."): đo các khối lớn trong app.py (tab HR, dashboard, ...)
+- Lệnh chậm hơn PERF_SLOW_MS được ghi vào log "perf"
+- Fragment tự chạy lại không gọi start_run → chỉ giữ PERF_MAX_RECORDS bản ghi gần nhất
+Cấu hình: PERF_INSTRUMENTATION=0 để tắt, PERF_SLOW_MS (mặc định 200),
+  PERF_BYTES_SAMPLE (50; 1 = đếm chính xác, 0 = không đếm byte của cursor), PERF_MAX_RECORDS (1000)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import bson
+
+PERF_ENABLED = os.environ.get("PERF_INSTRUMENTATION", "1") != "0"
+PERF_SLOW_MS = float(os.environ.get("PERF_SLOW_MS", "200"))
+PERF_BYTES_SAMPLE = int(os.environ.get("PERF_BYTES_SAMPLE", "50"))
+PERF_MAX_RECORDS = int(os.environ.get("PERF_MAX_RECORDS", "1000"))
+
+logger = logging.getLogger("perf")
+
+# Streamlit chạy mỗi lần rerun trên một thread riêng → lưu bản ghi theo thread
+_local = threading.local()
+
+# Lệnh trả về cursor (đo khi duyệt cursor) và lệnh đo ngay khi gọi
+_CURSOR_METHODS = {"find", "aggregate"}
+_TIMED_METHODS = {
+    "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write", "count_documents",
+    "estimated_document_count", "distinct", "create_index", "watch",
+}
+
+
+def start_run():
+    """Bắt đầu một lần rerun: xóa các bản ghi cũ của thread hiện tại"""
+    _local.records = deque(maxlen=PERF_MAX_RECORDS)
+    _local.block = None
+    _local.started = time.perf_counter()
+
+
+def get_records():
+    return list(getattr(_local, "records", []))
+
+
+def run_elapsed_ms():
+    started = getattr(_local, "started", None)
+    return (time.perf_counter() - started) * 1000 if started else 0.0
+
+
+def _new_record(kind, name):
+    record = {"kind": kind, "name": name, "block": getattr(_local, "block", None),
+              "ms": 0.0, "docs": 0, "bytes": 0}
+    records = getattr(_local, "records", None)
+    if records is not None:
+        records.append(record)
+    return record
+
+
+def _finish(record):
+    if record["ms"] >= PERF_SLOW_MS:
+        logger.warning("Chậm %.1f ms: %s (%s docs, %s bytes, block=%s)",
+                       record["ms"], record["name"], record["docs"], record["bytes"], record["block"])
+
+
+def _doc_size(doc):
+    try:
+        return len(bson.encode(doc))
+    except Exception:
+        return 0
+
+
+@contextmanager
+def perf_block(name):
+    """Đo một khối code trong app.py"""
+    parent = getattr(_local, "block", None)
+    _local.block = name
+    record = _new_record("block", name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record["ms"] = (time.perf_counter() - t0) * 1000
+        record["block"] = parent
+        _local.block = parent
+        _finish(record)
+
+
+class _TimedCursor:
+    """Bọc Cursor/CommandCursor: thời gian tính lúc lấy document (lúc thật sự gọi DB)"""
+
+    def __init__(self, cursor, record):
+        self._cursor = cursor
+        self._record = record
+        self._sampled_docs = 0
+        self._sampled_bytes = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # sort/skip/limit/... trả về chính cursor → giữ wrapper để còn đo
+            return self if result is self._cursor else result
+        return wrapper
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            doc = next(self._cursor)
+        except StopIteration:
+            self._record["ms"] += (time.perf_counter() - t0) * 1000
+            _finish(self._record)
+            raise
+        self._record["ms"] += (time.perf_counter() - t0) * 1000
+        self._record["docs"] += 1
+        # encode mọi document tốn gần bằng chính lần đọc → chỉ lấy mẫu rồi ước lượng
+        if PERF_BYTES_SAMPLE and (self._record["docs"] - 1) % PERF_BYTES_SAMPLE == 0:
+            self._sampled_docs += 1
+            self._sampled_bytes += _doc_size(doc)
+        if self._sampled_docs:
+            self._record["bytes"] = round(
+                self._sampled_bytes / self._sampled_docs * self._record["docs"])
+        return doc
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+class InstrumentedCollection:
+    """Proxy của pymongo Collection, đo các lệnh đọc/ghi"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in _CURSOR_METHODS and name not in _TIMED_METHODS:
+            return attr
+
+        op_name = f"{self._collection.name}.{name}"
+
+        def wrapper(*args, **kwargs):
+            record = _new_record("db", op_name)
+            t0 = time.perf_counter()
+            result = attr(*args, **kwargs)
+            record["ms"] += (time.perf_counter() - t0) * 1000
+            if name in _CURSOR_METHODS:
+                return _TimedCursor(result, record)
+            if isinstance(result, dict):
+                record["docs"] = 1
+                record["bytes"] = _doc_size(result)
+            _finish(record)
+            return result
+        return wrapper
+
+    def __getitem__(self, name):
+        return InstrumentedCollection(self._collection[name])
+
+
+class InstrumentedDatabase:
+    """Proxy của pymongo Database: db[name] trả về collection đã được bọc"""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return InstrumentedCollection(self._database[name])
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if name != "list_collection_names":
+            return attr
+
+        def wrapper(*args, **kwargs):
+            record = _new_record("db", f"{self._database.name}.{name}")
+            t0 = time.perf_counter()
+            result = attr(*args, **kwargs)
+            record["ms"] = (time.perf_counter() - t0) * 1000
+            record["docs"] = len(result)
+            _finish(record)
+            return result
+        return wrapper
+
+
+def instrument_database(database):
+    return InstrumentedDatabase(database) if PERF_ENABLED else database
+
+
+def render_perf_panel(container):
+    """Bảng thời gian của lần rerun hiện tại (chỉ hiển thị cho HR)"""
+    import streamlit as st
+
+    records = get_records()
+    db_records = [r for r in records if r["kind"] == "db"]
+    with container.container():
+        with st.expander("⏱️ Hiệu năng lần chạy này"):
+            st.caption(
+                f"Tổng {run_elapsed_ms():.0f} ms · {len(db_records)} lệnh DB · "
+                f"{sum(r['ms'] for r in db_records):.0f} ms DB · "
+                f"{sum(r['docs'] for r in db_records)} docs · "
+                f"≈ {sum(r['bytes'] for r in db_records) / 1024:.0f} KB")
+            if records:
+                st.dataframe(
+                    [{**r, "ms": round(r["ms"], 1)} for r in records],
+                    use_container_width=True, hide_index=True)
+            st.caption(f"Log lệnh chậm khi ≥ {PERF_SLOW_MS:.0f} ms (PERF_SLOW_MS)")
@@ -0,0 +1,63 @@
+# leave_dates.py
+"""
+Ngày tháng của yêu cầu nghỉ
+- Dữ liệu mới lưu start_date / end_date / requested_at / approved_at dạng datetime (BSON date)
+- Dữ liệu cũ còn dạng chuỗi "YYYY-MM-DD" / "YYYY-MM-DD HH:MM:SS" cho tới khi chạy
+  migrate_leave_dates.py → các hàm dưới đây đọc được cả hai
+"""
+from datetime import date, datetime
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FIELDS = ("start_date", "end_date", "requested_at", "approved_at")
+
+
+def to_datetime(value):
+    """datetime / date / chuỗi cũ → datetime, không đọc được → None"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        for fmt in (DATETIME_FORMAT, DATE_FORMAT):
+            try:
+                return datetime.strptime(value.strip(), fmt)
+            except ValueError:
+                continue
+    return None
+
+
+def format_date(value, fmt=DATE_FORMAT):
+    """Hiển thị ngày: datetime → chuỗi theo fmt, chuỗi cũ giữ nguyên"""
+    if value is None or value != value:  # None / NaN / NaT
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime(fmt)
+    return str(value)
+
+
+def month_key(value):
+    """'YYYY-MM' của một ngày (datetime hoặc chuỗi cũ)"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m")
+    return str(value or "")[:7]
+
+
+def month_expr(field="$start_date"):
+    """Biểu thức aggregation tính 'YYYY-MM', chạy được với cả date và chuỗi"""
+    return {"$cond": [
+        {"$eq": [{"$type": field}, "date"]},
+        {"$dateToString": {"format": "%Y-%m", "date": field}},
+        {"$substrCP": [{"$ifNull": [field, ""]}, 0, 7]},
+    ]}
+
+
+def period_range(year, month=None):
+    """[đầu kỳ, đầu kỳ sau) của một năm hoặc một tháng"""
+    year = int(year)
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    month = int(month)
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
@@ -0,0 +1,176 @@
+# leave_feed.py
+"""
+Danh sách yêu cầu nghỉ của tab HR, chỉ truy vấn lại khi dữ liệu thay đổi
+- LeaveFeed (lưu trong session): giữ trang đang xem (query_leaves: lọc, sắp xếp, phân trang và
+  đếm trên MongoDB); rerun / tự cập nhật mà không có thay đổi → không truy vấn trang
+- Mỗi lần refresh kiểm tra leaves có thay đổi hay không:
+  * change stream (replica set): một luồng nền cho cả process ghi lại _id thay đổi (kể cả xóa);
+    stream bị ngắt → quay về polling, sau LEAVE_FEED_WATCH_RETRY giây thử mở lại
+  * không có change stream (standalone): so get_data_version("leaves") — mọi lần ghi của app
+    (gửi, duyệt, tab Sheets, import) đều tăng version, thêm / xóa ngoài app làm đổi số document
+
+Biến môi trường: LEAVE_FEED_BUFFER (10000) — số sự kiện change stream giữ trong bộ nhớ,
+  LEAVE_FEED_WATCH_RETRY (60)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+from pymongo.errors import PyMongoError
+
+from settings import LEAVES_COL
+from functions import query_leaves
+from versioning import get_data_version
+
+logger = logging.getLogger(__name__)
+
+FEED_BUFFER = int(os.environ.get("LEAVE_FEED_BUFFER", 10000))
+WATCH_RETRY = int(os.environ.get("LEAVE_FEED_WATCH_RETRY", 60))
+
+
+class ChangeWatcher:
+    """Đọc change stream của LEAVES_COL trong luồng nền, đánh số thứ tự từng sự kiện"""
+
+    def __init__(self, collection, maxlen=FEED_BUFFER):
+        self.seq = 0
+        self.available = False
+        self.stopped_at = time.monotonic()  # lúc không dùng được nữa (get_change_watcher mở lại)
+        self._events = deque(maxlen=maxlen)  # (seq, _id, operationType)
+        self._lock = threading.Lock()
+        try:
+            # Chỉ cần documentKey, không cần cả document
+            self._stream = collection.watch(
+                [{"$project": {"documentKey": 1, "operationType": 1}}])
+        except Exception as e:  # standalone mongod / không có quyền / mongomock → dùng polling
+            logger.info("Không dùng được change stream, chuyển sang polling: %s", e)
+            return
+        self.available = True
+        threading.Thread(target=self._run, name="leave-feed-watcher", daemon=True).start()
+
+    def _run(self):
+        try:
+            for change in self._stream:
+                with self._lock:
+                    self.seq += 1
+                    self._events.append(
+                        (self.seq, change["documentKey"]["_id"], change["operationType"]))
+        except PyMongoError as e:
+            logger.warning("Change stream bị ngắt, chuyển sang polling: %s", e)
+        self.stopped_at = time.monotonic()
+        self.available = False
+
+    def since(self, seq):
+        """
+        (_id thay đổi, _id bị xóa, seq mới) kể từ seq
+        - None nếu không còn đủ sự kiện (buffer đã tràn / watcher đã dừng) → phải tải lại
+        """
+        with self._lock:
+            if not self.available:
+                return None
+            if seq < self.seq and (not self._events or self._events[0][0] > seq + 1):
+                return None
+            changed, deleted = set(), set()
+            for event_seq, doc_id, op in self._events:
+                if event_seq <= seq:
+                    continue
+                if op == "delete":
+                    deleted.add(doc_id)
+                    changed.discard(doc_id)
+                else:
+                    changed.add(doc_id)
+                    deleted.discard(doc_id)
+            return changed, deleted, self.seq
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_watcher():
+    return ChangeWatcher(LEAVES_COL)
+
+
+_watcher_lock = threading.Lock()
+
+
+def get_change_watcher():
+    """Một watcher cho cả process; không dùng được quá WATCH_RETRY giây → tạo lại"""
+    watcher = _cached_watcher()
+    if watcher.available or time.monotonic() - watcher.stopped_at < WATCH_RETRY:
+        return watcher
+    with _watcher_lock:
+        if _cached_watcher() is watcher:
+            _cached_watcher.clear()
+        return _cached_watcher()
+
+
+class LeaveFeed:
+    """
+    Trang đang xem của một bộ lọc trong tab HR
+    - Lọc, sắp xếp, phân trang, đếm đều chạy trên MongoDB (query_leaves), session chỉ giữ một trang
+    - Change stream / data version chỉ dùng để biết có thay đổi hay không → có thì truy vấn lại trang
+    """
+
+    def __init__(self, filters):
+        self.filters = filters  # tham số lọc của query_leaves
+        self.loaded = False
+        self.watcher = None       # watcher lúc tải (chế độ change stream), None → polling
+        self.watcher_seq = None
+        self.data_version = None  # (version, số document) của leaves lúc tải (chế độ polling)
+        self._page_key = None     # (page, page_size) của trang đang giữ, None → phải truy vấn lại
+        self._rows, self._total = [], 0
+
+    def reload(self):
+        """Đặt lại mốc kiểm tra, trang được truy vấn lại (lần đầu, mất sự kiện, HR bấm tải lại)"""
+        watcher = get_change_watcher()
+        # Lấy mốc trước khi đọc trang: thay đổi xảy ra trong lúc đọc được báo ở lần sau
+        if watcher.available:
+            self.watcher, self.watcher_seq = watcher, watcher.seq
+        else:
+            self.watcher = self.watcher_seq = None
+            self.data_version = get_data_version("leaves")
+        self.loaded = True
+        self.invalidate()
+
+    def invalidate(self):
+        """Trang hiện tại truy vấn lại ở lần page() kế tiếp (vd. ngay sau khi HR duyệt)"""
+        self._page_key = None
+
+    def _changed(self):
+        """True / False: leaves có thay đổi kể từ lần kiểm tra trước; None → phải tải lại"""
+        watcher = get_change_watcher()
+        if self.watcher is not None:
+            # Watcher đã được tạo lại → số thứ tự sự kiện không còn so được
+            delta = watcher.since(self.watcher_seq) if watcher is self.watcher else None
+            if delta is None:
+                return None
+            changed, deleted, self.watcher_seq = delta
+            return bool(changed or deleted)
+        if watcher.available:  # change stream vừa mở lại → chuyển sang
+            return None
+        version = get_data_version("leaves")
+        if version == self.data_version:
+            return False
+        self.data_version = version
+        return True
+
+    def refresh(self):
+        """Kiểm tra thay đổi kể từ lần trước, trả về True nếu trang phải truy vấn lại"""
+        if not self.loaded:
+            self.reload()
+            return False
+        changed = self._changed()
+        if changed is None:
+            self.reload()
+            return True
+        if changed:
+            self.invalidate()
+        return changed
+
+    def page(self, page, page_size):
+        """(list yêu cầu của trang, tổng số) — chỉ truy vấn khi đổi trang hoặc có thay đổi"""
+        if self._page_key != (page, page_size):
+            self._rows, self._total = query_leaves(
+                **self.filters, page=page, page_size=page_size)
+            self._page_key = (page, page_size)
+        return self._rows, self._total
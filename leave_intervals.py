@@ -0,0 +1,185 @@
+# leave_intervals.py
+"""
+Chỉ mục khoảng ngày nghỉ dùng chung cho mọi session trong process
+- Chỉ tính các yêu cầu đang hiệu lực: pending / approved
+- Theo nhân viên: list khoảng (start, end) sắp theo start → tìm yêu cầu trùng ngày bằng bisect
+- Theo phòng ban: ngày → tập _id đang nghỉ → đếm số người nghỉ cùng ngày mà không quét LEAVES_COL
+- Cập nhật dần khi gửi / duyệt / từ chối; hết hạn sau TTL giây (thay đổi từ process khác)
+
+Biến môi trường: MAX_CONCURRENT_ABSENCES (2) — số người cùng phòng ban nghỉ cùng ngày trước khi cảnh báo
+"""
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+
+import streamlit as st
+
+from settings import LEAVES_COL
+from leave_dates import to_datetime
+
+INTERVALS_TTL_SECONDS = 300
+ACTIVE_STATUSES = ("pending", "approved")
+MAX_CONCURRENT_ABSENCES = int(os.environ.get("MAX_CONCURRENT_ABSENCES", 2))
+MAX_SPAN_DAYS = 366  # khoảng dài hơn (dữ liệu lỗi) chỉ được đánh chỉ mục 366 ngày đầu
+
+
+def _ordinal(value):
+    """date / datetime / chuỗi cũ → số ngày (date.toordinal), không đọc được → None"""
+    if isinstance(value, date) and not hasattr(value, "hour"):
+        return value.toordinal()
+    value = to_datetime(value)
+    return value.toordinal() if value else None
+
+
+class LeaveIntervalIndex:
+    def __init__(self, ttl=INTERVALS_TTL_SECONDS):
+        self.ttl = ttl
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._leaves = {}                    # _id → (full_name, department, start, end, status)
+        self._by_employee = defaultdict(list)  # full_name → [(start, end, _id)] sắp theo start
+        self._by_department = defaultdict(lambda: defaultdict(set))  # phòng ban → ngày → {_id}
+
+    # --- Cập nhật cấu trúc (gọi khi đang giữ lock) ---
+    def _add(self, leave):
+        start, end = _ordinal(leave.get("start_date")), _ordinal(leave.get("end_date"))
+        if start is None:
+            return
+        end = start if end is None or end < start else min(end, start + MAX_SPAN_DAYS - 1)
+        name, department = leave.get("full_name"), leave.get("department") or ""
+        self._leaves[leave["_id"]] = (name, department, start, end, leave.get("status"))
+        bisect.insort(self._by_employee[name], (start, end, leave["_id"]))
+        days = self._by_department[department]
+        for day in range(start, end + 1):
+            days[day].add(leave["_id"])
+
+    def _remove(self, leave_id):
+        entry = self._leaves.pop(leave_id, None)
+        if entry is None:
+            return
+        name, department, start, end, _ = entry
+        intervals = self._by_employee[name]
+        i = bisect.bisect_left(intervals, (start, end, leave_id))
+        if i < len(intervals) and intervals[i][2] == leave_id:
+            del intervals[i]
+        days = self._by_department[department]
+        for day in range(start, end + 1):
+            days[day].discard(leave_id)
+            if not days[day]:
+                del days[day]
+
+    def _load(self):
+        self._leaves = {}
+        self._by_employee = defaultdict(list)
+        self._by_department = defaultdict(lambda: defaultdict(set))
+        cursor = LEAVES_COL.find(
+            {"status": {"$in": list(ACTIVE_STATUSES)}},
+            {"full_name": 1, "department": 1, "start_date": 1, "end_date": 1, "status": 1})
+        for leave in cursor:
+            self._add(leave)
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+
+    # --- Cập nhật dần ---
+    def add(self, leave):
+        """Yêu cầu mới vừa được lưu (đã có _id)"""
+        with self._lock:
+            if self._loaded_at is not None and leave.get("status") in ACTIVE_STATUSES:
+                self._remove(leave["_id"])
+                self._add(leave)
+
+    def set_status(self, leave_ids, status):
+        """Yêu cầu được duyệt → giữ lại; bị từ chối → bỏ khỏi chỉ mục"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for leave_id in leave_ids:
+                entry = self._leaves.get(leave_id)
+                if entry is None:
+                    continue
+                if status in ACTIVE_STATUSES:
+                    self._leaves[leave_id] = entry[:4] + (status,)
+                else:
+                    self._remove(leave_id)
+
+    def refresh(self):
+        """Load lại ngay từ LEAVES_COL (benchmark / khởi động), trả về số yêu cầu trong chỉ mục"""
+        with self._lock:
+            self._load()
+            return len(self._leaves)
+
+    def invalidate(self):
+        """Dữ liệu bị sửa hàng loạt (tab Sheets, import) → lần đọc sau load lại"""
+        with self._lock:
+            self._loaded_at = None
+
+    # --- Truy vấn ---
+    def overlapping(self, full_name, start_date, end_date, exclude_id=None):
+        """Các yêu cầu pending/approved của nhân viên có ngày trùng với [start_date, end_date]"""
+        start, end = _ordinal(start_date), _ordinal(end_date)
+        if start is None:
+            return []
+        end = start if end is None or end < start else end
+        with self._lock:
+            self._ensure_fresh()
+            intervals = self._by_employee.get(full_name, [])
+            # Chỉ các khoảng bắt đầu trước ngày kết thúc mới có thể trùng
+            stop = bisect.bisect_right(intervals, (end, float("inf")))
+            return [{
+                "_id": leave_id,
+                "start_date": date.fromordinal(s),
+                "end_date": date.fromordinal(e),
+                "status": self._leaves[leave_id][4],
+            } for s, e, leave_id in intervals[:stop] if e >= start and leave_id != exclude_id]
+
+    def concurrent_absences(self, department, start_date, end_date, exclude_name=None):
+        """{ngày: [tên nhân viên]} của những người cùng phòng ban nghỉ trong [start_date, end_date]"""
+        start, end = _ordinal(start_date), _ordinal(end_date)
+        if start is None:
+            return {}
+        end = start if end is None or end < start else min(end, start + MAX_SPAN_DAYS - 1)
+        with self._lock:
+            self._ensure_fresh()
+            days = self._by_department.get(department or "", {})
+            result = {}
+            for day in range(start, end + 1):
+                names = {self._leaves[i][0] for i in days.get(day, ())} - {exclude_name}
+                if names:
+                    result[date.fromordinal(day)] = sorted(names)
+            return result
+
+    def busy_days(self, department, start_date, end_date, exclude_name=None,
+                  limit=MAX_CONCURRENT_ABSENCES):
+        """Các ngày đã có ít nhất `limit` người khác trong phòng ban nghỉ"""
+        return {day: names for day, names in
+                self.concurrent_absences(department, start_date, end_date, exclude_name).items()
+                if len(names) >= limit}
+
+    def stats(self):
+        return {"leaves": len(self._leaves), "loads": self.loads}
+
+
+@st.cache_resource(show_spinner=False)
+def get_interval_index():
+    """LeaveIntervalIndex dùng chung cho cả process"""
+    return LeaveIntervalIndex()
+
+
+def index_leave(leave):
+    get_interval_index().add(leave)
+
+
+def index_status_change(leave_ids, status):
+    get_interval_index().set_status(leave_ids, status)
+
+
+def invalidate_intervals():
+    get_interval_index().invalidate()
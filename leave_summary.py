@@ -0,0 +1,205 @@
+# leave_summary.py
+"""
+Bảng tổng hợp nghỉ phép được cập nhật dần (materialized summary)
+- Mỗi document: tháng × phòng ban × loại nghỉ × trạng thái → count, duration
+- send_leave_request (qua submission_queue) / approve_leave / reject_leave cập nhật bằng $inc
+- rebuild_leave_summary(): tính lại từ LEAVES_COL và báo chênh lệch; chỉ sửa các ô lệch bằng
+  $inc (upsert) phần chênh → $inc của các lần ghi đồng thời không bị ghi đè
+  * chênh lệch phải giống nhau ở hai lần so liên tiếp mới sửa: yêu cầu vừa ghi mà $inc chưa
+    tới chỉ lệch thoáng qua, tự hết ở lần so sau
+  * hai lần dựng lại chạy song song có thể cùng sửa một ô → chạy lại cũng tự cân bằng
+- Sửa / import leaves qua tab Sheets không đi qua các hàm trên → save_dataframe / import_file
+  gọi schedule_leave_summary_rebuild(): dựng lại ở luồng nền, gọi dồn chỉ chạy thêm một lượt
+Chạy từ CLI:  python leave_summary.py [--dry-run]
+"""
+import argparse
+import logging
+import sys
+import threading
+from pymongo import UpdateOne
+
+from leave_dates import month_key, month_expr
+from settings import LEAVES_COL, LEAVE_SUMMARY_COL, ANALYTICS_LEAVE_SUMMARY_COL
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ("month", "department", "leave_type", "status")
+
+
+def _duration(leave):
+    try:
+        return float(leave.get("duration") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def summary_key(leave, status=None):
+    """_id của dòng tổng hợp ứng với một yêu cầu nghỉ (thứ tự field cố định)"""
+    return {
+        "month": month_key(leave.get("start_date")),
+        "department": leave.get("department") or "",
+        "leave_type": leave.get("leave_type") or "",
+        "status": status or leave.get("status") or "",
+    }
+
+
+def _inc_op(leave, sign, status=None):
+    return UpdateOne(
+        {"_id": summary_key(leave, status)},
+        {"$inc": {"count": sign, "duration": sign * _duration(leave)}},
+        upsert=True,
+    )
+
+
+def add_leave_ops(leave):
+    """Các lệnh $inc cho một yêu cầu mới (ghi theo lô cùng các yêu cầu khác)"""
+    return [_inc_op(leave, 1)]
+
+
+def add_leave_to_summary(leave):
+    """Yêu cầu mới → +1 vào ô tương ứng"""
+    LEAVE_SUMMARY_COL.bulk_write(add_leave_ops(leave))
+
+
+def move_status_ops(leave, old_status, new_status):
+    """Các lệnh $inc khi đổi trạng thái: trừ ô cũ, cộng ô mới"""
+    if old_status == new_status:
+        return []
+    return [_inc_op(leave, -1, old_status), _inc_op(leave, 1, new_status)]
+
+
+def move_leave_status(leave, old_status, new_status):
+    """Đổi trạng thái của một yêu cầu"""
+    ops = move_status_ops(leave, old_status, new_status)
+    if ops:
+        LEAVE_SUMMARY_COL.bulk_write(ops, ordered=False)
+
+
+def _expected_summary():
+    """Tính lại toàn bộ bảng tổng hợp từ LEAVES_COL bằng aggregation"""
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "month": month_expr("$start_date"),
+                "department": {"$ifNull": ["$department", ""]},
+                "leave_type": {"$ifNull": ["$leave_type", ""]},
+                "status": {"$ifNull": ["$status", ""]},
+            },
+            "count": {"$sum": 1},
+            "duration": {"$sum": {"$convert": {
+                "input": "$duration", "to": "double", "onError": 0, "onNull": 0}}},
+        }}
+    ]
+    return {tuple(d["_id"][f] for f in SUMMARY_FIELDS): d for d in LEAVES_COL.aggregate(pipeline)}
+
+
+def _summary_drift():
+    """{key: (count, duration) cần $inc thêm} của các ô đang lưu lệch so với LEAVES_COL"""
+    expected = _expected_summary()
+    current = {tuple(d["_id"].get(f, "") for f in SUMMARY_FIELDS): d
+               for d in LEAVE_SUMMARY_COL.find({})}
+    drift = {}
+    for key in set(expected) | set(current):
+        exp = expected.get(key, {})
+        cur = current.get(key, {})
+        delta = (exp.get("count", 0) - cur.get("count", 0),
+                 round(exp.get("duration", 0) - cur.get("duration", 0), 2))
+        if delta != (0, 0):
+            drift[key] = (delta, (cur.get("count", 0), round(cur.get("duration", 0), 2)))
+    return drift
+
+
+def rebuild_leave_summary(dry_run=False):
+    """
+    Tính lại bảng tổng hợp và so với bản đang lưu
+    - Trả về danh sách chênh lệch (key, count/duration đang lưu, count/duration đúng)
+    - dry_run=False: $inc phần chênh vào các ô lệch ổn định (giống nhau ở hai lần so)
+    """
+    drift = _summary_drift()
+    report = [(dict(zip(SUMMARY_FIELDS, key)), cur,
+               (cur[0] + delta[0], round(cur[1] + delta[1], 2)))
+              for key, (delta, cur) in drift.items()]
+    if dry_run or not drift:
+        return report
+
+    again = _summary_drift()
+    ops = [UpdateOne({"_id": dict(zip(SUMMARY_FIELDS, key))},
+                     {"$inc": {"count": delta[0], "duration": delta[1]}}, upsert=True)
+           for key, (delta, _) in drift.items()
+           if key in again and again[key][0] == delta]
+    if ops:
+        LEAVE_SUMMARY_COL.bulk_write(ops, ordered=False)
+    return report
+
+
+_rebuild_state = {"running": False, "again": False}
+_rebuild_lock = threading.Lock()
+
+
+def _rebuild_loop():
+    while True:
+        try:
+            rebuild_leave_summary()
+        except Exception:  # luồng nền không được làm hỏng lần lưu của người dùng
+            logger.exception("Lỗi khi dựng lại bảng tổng hợp nghỉ phép")
+        with _rebuild_lock:
+            if not _rebuild_state["again"]:
+                _rebuild_state["running"] = False
+                return
+            _rebuild_state["again"] = False
+
+
+def schedule_leave_summary_rebuild():
+    """Dựng lại bảng tổng hợp ở luồng nền; đang chạy thì chỉ đánh dấu chạy thêm một lượt"""
+    with _rebuild_lock:
+        if _rebuild_state["running"]:
+            _rebuild_state["again"] = True
+            return
+        _rebuild_state["running"] = True
+    threading.Thread(target=_rebuild_loop, name="leave-summary-rebuild", daemon=True).start()
+
+
+def load_summary_totals():
+    """Tổng hợp theo phòng ban / trạng thái / tháng đọc từ bảng tổng hợp"""
+    # Lần đầu triển khai: bảng tổng hợp còn trống → dựng từ LEAVES_COL
+    if not LEAVE_SUMMARY_COL.estimated_document_count() and LEAVES_COL.estimated_document_count():
+        rebuild_leave_summary()
+
+    pipeline = [
+        {"$facet": {
+            "dept_summary": [
+                {"$group": {"_id": "$_id.department", "duration": {"$sum": "$duration"}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "status_summary": [
+                {"$group": {"_id": "$_id.status", "count": {"$sum": "$count"}}},
+                {"$match": {"count": {"$gt": 0}}},
+                {"$sort": {"count": -1}},
+            ],
+            "monthly": [
+                {"$group": {"_id": "$_id.month", "duration": {"$sum": "$duration"}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }}
+    ]
+    return next(ANALYTICS_LEAVE_SUMMARY_COL.aggregate(pipeline), None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tính lại bảng tổng hợp nghỉ phép")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Chỉ báo chênh lệch, không ghi")
+    args = parser.parse_args(argv)
+
+    drift = rebuild_leave_summary(dry_run=args.dry_run)
+    for key, cur, exp in drift:
+        print(f"⚠️ {key}: đang lưu {cur} → đúng {exp}")
+    print(f"Tổng số dòng chênh lệch: {len(drift)}")
+    if args.dry_run and drift:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
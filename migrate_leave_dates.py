@@ -0,0 +1,96 @@
+# migrate_leave_dates.py
+"""
+Chuyển start_date / end_date / requested_at / approved_at của LEAVES_COL từ chuỗi sang datetime
+- Chạy theo batch, sắp theo _id; vị trí đã xử lý lưu trong _meta → dừng giữa chừng chạy lại sẽ tiếp tục
+- Mỗi lệnh update có điều kiện trên giá trị cũ: document bị sửa trong lúc migrate sẽ không bị ghi đè
+Chạy từ CLI:  python migrate_leave_dates.py [--batch-size 1000] [--dry-run] [--restart]
+"""
+import argparse
+import sys
+
+from pymongo import UpdateOne
+
+from leave_dates import DATE_FIELDS, to_datetime
+from settings import LEAVES_COL, META_COL
+from versioning import bump_data_version, new_version, VERSION_FIELD
+
+MIGRATION_ID = "migration:leave_dates"
+
+
+def migrate_batch(last_id, batch_size, dry_run=False):
+    """
+    Xử lý một batch sau last_id
+    - Trả về (_id cuối của batch hoặc None nếu hết, số document đổi, danh sách _id không đọc được)
+    """
+    query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+    docs = list(LEAVES_COL.find(query, {f: 1 for f in DATE_FIELDS})
+                .sort("_id", 1).limit(batch_size))
+    if not docs:
+        return None, 0, []
+
+    ops, unparsable = [], []
+    for doc in docs:
+        old_values, changes = {}, {}
+        for field in DATE_FIELDS:
+            value = doc.get(field)
+            if not isinstance(value, str):
+                continue
+            parsed = to_datetime(value)
+            if parsed is None:
+                if value.strip():
+                    unparsable.append(doc["_id"])
+                continue
+            old_values[field] = value
+            changes[field] = parsed
+        if changes:
+            changes[VERSION_FIELD] = new_version()  # để tab Sheets biết dòng đã đổi
+            ops.append(UpdateOne({"_id": doc["_id"], **old_values}, {"$set": changes}))
+
+    if ops and not dry_run:
+        LEAVES_COL.bulk_write(ops, ordered=False)
+    return docs[-1]["_id"], len(ops), unparsable
+
+
+def migrate(batch_size=1000, dry_run=False, restart=False, progress=print):
+    state = META_COL.find_one({"_id": MIGRATION_ID}) or {}
+    last_id = None if restart else state.get("last_id")
+    converted, unparsable = 0, []
+
+    while True:
+        next_id, changed, bad = migrate_batch(last_id, batch_size, dry_run)
+        if next_id is None:
+            break
+        last_id = next_id
+        converted += changed
+        unparsable.extend(bad)
+        if not dry_run:
+            META_COL.update_one({"_id": MIGRATION_ID}, {
+                                "$set": {"last_id": last_id}}, upsert=True)
+        progress(f"… tới _id {last_id}: {converted} document đã chuyển")
+
+    if converted and not dry_run:
+        bump_data_version("leaves")
+    return converted, unparsable
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Chuyển ngày tháng của leaves sang kiểu date")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Chỉ đếm, không ghi")
+    parser.add_argument("--restart", action="store_true",
+                        help="Bỏ qua vị trí đã lưu, chạy lại từ đầu")
+    args = parser.parse_args(argv)
+
+    converted, unparsable = migrate(
+        args.batch_size, args.dry_run, args.restart)
+    print(f"✅ {converted} document {'cần chuyển' if args.dry_run else 'đã chuyển'}")
+    if unparsable:
+        print(f"⚠️ {len(unparsable)} document có ngày không đọc được, ví dụ: {unparsable[:10]}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# mongo_client.py
+"""
+Tạo MongoClient dùng chung cho cả process (mọi session Streamlit)
+- Pool, timeout, nén cấu hình bằng biến môi trường
+- Client riêng (hoặc read preference riêng) cho các truy vấn phân tích:
+  dashboard, thống kê collection, export → không tranh primary với lệnh duyệt/ghi
+  (bảng sửa ở tab Sheets vẫn đọc từ primary để _version không bị trễ)
+- pool_stats(): số kết nối đang mở / đang dùng / lượt mượn để theo dõi
+
+Biến môi trường:
+  MONGO_MAX_POOL_SIZE (50), MONGO_MIN_POOL_SIZE (0),
+  MONGO_SERVER_SELECTION_TIMEOUT_MS (5000), MONGO_CONNECT_TIMEOUT_MS (5000),
+  MONGO_SOCKET_TIMEOUT_MS (30000), MONGO_COMPRESSORS ("zlib"),
+  MONGO_ANALYTICS_URL (mặc định dùng chung cluster),
+  MONGO_ANALYTICS_READ_PREFERENCE ("secondaryPreferred"),
+  MONGO_ANALYTICS_MAX_POOL_SIZE (10)
+"""
+import os
+import threading
+
+import streamlit as st
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def client_options(max_pool_size=None):
+    """Tham số chung cho MongoClient"""
+    return {
+        "maxPoolSize": max_pool_size or _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "compressors": os.environ.get("MONGO_COMPRESSORS", "zlib"),
+        "appname": "app_for_hr",
+    }
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Đếm sự kiện của connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {"open": 0, "in_use": 0, "checkouts": 0,
+                      "checkout_failed": 0, "created": 0, "closed": 0}
+
+    def _add(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def connection_created(self, event):
+        self._add(open=1, created=1)
+
+    def connection_closed(self, event):
+        self._add(open=-1, closed=1)
+
+    def connection_checked_out(self, event):
+        self._add(in_use=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._add(in_use=-1)
+
+    def connection_check_out_failed(self, event):
+        self._add(checkout_failed=1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+_listeners = {}
+
+
+def _make_client(url, name, max_pool_size=None):
+    listener = PoolStatsListener()
+    _listeners[name] = listener
+    return MongoClient(url, event_listeners=[listener], **client_options(max_pool_size))
+
+
+@st.cache_resource(show_spinner=False)
+def get_client(url):
+    """Client chính (đọc/ghi), một instance cho cả process"""
+    return _make_client(url, "primary")
+
+
+@st.cache_resource(show_spinner=False)
+def get_analytics_client(url):
+    """Client cho truy vấn phân tích; không cấu hình URL riêng → dùng chung client chính"""
+    analytics_url = os.environ.get("MONGO_ANALYTICS_URL")
+    if not analytics_url:
+        return get_client(url)
+    return _make_client(analytics_url, "analytics",
+                        _env_int("MONGO_ANALYTICS_MAX_POOL_SIZE", 10))
+
+
+def analytics_read_preference():
+    mode = os.environ.get(
+        "MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    return make_read_preference(read_pref_mode_from_name(mode), None)
+
+
+def pool_stats():
+    """{tên client: số liệu pool}"""
+    return {name: listener.snapshot() for name, listener in _listeners.items()}
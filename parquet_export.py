@@ -0,0 +1,245 @@
+# parquet_export.py
+"""
+Xuất LEAVES_COL / EMPLOYEES_COL ra Parquet cho phân tích (thay cho tải Excel toàn bộ collection)
+- leaves: chia thư mục theo năm/tháng của start_date (leaves/year=2025/month=03/part-<run>.parquet)
+- Mỗi lần chạy chỉ ghi thêm các document mới (_id) hoặc vừa duyệt/từ chối (approved_at)
+  kể từ watermark lần trước; bản ghi cũ của cùng _id được thay khi đọc (giữ _run lớn nhất)
+- Watermark lùi EXPORT_LAG_SECONDS so với hiện tại: yêu cầu từ hàng đợi ghi nền / secondary
+  đến trễ vẫn rơi vào lần chạy sau, không bị bỏ sót
+- employees: ghi lại toàn bộ mỗi lần (ít dòng, remaining_days đổi bằng $inc không có mốc thời gian)
+- Sửa trực tiếp trong tab Sheets / xóa document không có mốc thời gian → chạy lại với --full;
+  --full ghi vào thư mục bên cạnh (leaves.full) rồi đổi tên thay thư mục cũ, dashboard không
+  bao giờ đọc phải thư mục rỗng / ghi dở
+- read_leaves_snapshot(): đọc bằng memory map, dashboard dùng thay vì truy vấn MongoDB
+Chạy từ CLI:  python parquet_export.py [--dir exports] [--full]
+
+Biến môi trường: PARQUET_EXPORT_DIR ("exports"), EXPORT_LAG_SECONDS (60)
+Cần pyarrow (requirements.txt)
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from settings import ANALYTICS_LEAVES_COL, EMPLOYEES_COL
+from leave_dates import DATE_FIELDS, to_datetime
+
+EXPORT_DIR = os.environ.get("PARQUET_EXPORT_DIR", "exports")
+EXPORT_LAG = timedelta(seconds=int(os.environ.get("EXPORT_LAG_SECONDS", 60)))
+# Nằm trong thư mục leaves (pyarrow bỏ qua file bắt đầu bằng "_"): xóa thư mục = xuất lại từ đầu
+WATERMARK_FILE = "_watermark.json"
+
+LEAVE_COLUMNS = {
+    "_id": "string", "full_name": "string", "department": "string",
+    "leave_type": "string", "leave_case": "string", "reason": "string",
+    "status": "string", "approved_by": "string", "duration": "float64",
+    "start_date": "timestamp", "end_date": "timestamp",
+    "requested_at": "timestamp", "approved_at": "timestamp",
+    "_run": "int64",
+}
+
+
+def _leave_schema():
+    import pyarrow as pa
+    types = {"string": pa.string(), "float64": pa.float64(),
+             "timestamp": pa.timestamp("ms"), "int64": pa.int64()}
+    return pa.schema([(name, types[kind]) for name, kind in LEAVE_COLUMNS.items()])
+
+
+def _leave_row(doc, run):
+    row = {name: doc.get(name) for name in LEAVE_COLUMNS}
+    row["_id"] = str(doc["_id"])
+    for field in DATE_FIELDS:
+        row[field] = to_datetime(row[field]) if isinstance(row[field], str) else row[field]
+    for field in ("full_name", "department", "leave_type", "leave_case", "reason",
+                  "status", "approved_by"):
+        row[field] = None if row[field] is None else str(row[field])
+    try:
+        row["duration"] = None if row["duration"] is None else float(row["duration"])
+    except (TypeError, ValueError):
+        row["duration"] = None
+    row["_run"] = run
+    return row
+
+
+def _watermark_path(export_dir):
+    """Watermark hiện tại; bản xuất cũ để watermark ngay trong export_dir"""
+    path = os.path.join(export_dir, "leaves", WATERMARK_FILE)
+    legacy = os.path.join(export_dir, WATERMARK_FILE)
+    if not os.path.exists(path) and os.path.exists(legacy):
+        return legacy
+    return path
+
+
+def _read_watermark(export_dir):
+    path = _watermark_path(export_dir)
+    if not os.path.exists(path):
+        return {"run": 0, "last_id": None, "last_approved_at": None}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump_json(data, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def _write_atomic(path, write):
+    """Ghi ra file tạm (tên bắt đầu bằng ".", pyarrow bỏ qua) rồi đổi tên: không ai đọc file ghi dở"""
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{name}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _swap_dir(new_dir, live_dir):
+    """Thay live_dir bằng new_dir bằng hai lần đổi tên, rồi mới xóa thư mục cũ"""
+    old_dir = live_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(live_dir):
+        os.rename(live_dir, old_dir)
+    os.rename(new_dir, live_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _changed_leaves_query(watermark, upper_id, upper_at):
+    """Các document mới hoặc vừa đổi trạng thái trong (watermark, upper]"""
+    if watermark["last_id"] is None:
+        return {"_id": {"$lt": upper_id}}  # lần đầu: toàn bộ
+    lower_at = datetime.fromisoformat(watermark["last_approved_at"])
+    return {"$or": [
+        {"_id": {"$gte": ObjectId(watermark["last_id"]), "$lt": upper_id}},
+        {"approved_at": {"$gte": lower_at, "$lt": upper_at}},
+    ]}
+
+
+def export_leaves(export_dir=EXPORT_DIR, full=False):
+    """
+    Ghi các yêu cầu nghỉ thay đổi từ lần chạy trước
+    - full: xuất lại từ đầu vào leaves.full, xong mới đổi tên thay thư mục leaves
+    - Trả về {"run", "rows", "partitions"}
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    live_dir = os.path.join(export_dir, "leaves")
+    if full:
+        leaves_dir = live_dir + ".full"
+        shutil.rmtree(leaves_dir, ignore_errors=True)  # lần --full trước bị ngắt giữa chừng
+        watermark = {"run": 0, "last_id": None, "last_approved_at": None}
+    else:
+        leaves_dir = live_dir
+        watermark = _read_watermark(export_dir)
+    run = watermark["run"] + 1
+
+    upper_at = datetime.utcnow().replace(microsecond=0) - EXPORT_LAG
+    upper_id = ObjectId.from_datetime(upper_at)
+    query = _changed_leaves_query(watermark, upper_id, upper_at)
+
+    partitions = {}
+    for doc in ANALYTICS_LEAVES_COL.find(query, {name: 1 for name in LEAVE_COLUMNS}):
+        row = _leave_row(doc, run)
+        start = row["start_date"]
+        key = (start.year, start.month) if start else (0, 0)
+        partitions.setdefault(key, []).append(row)
+
+    schema = _leave_schema()
+    for (year, month), rows in partitions.items():
+        path = os.path.join(leaves_dir, f"year={year:04d}", f"month={month:02d}",
+                            f"part-{run:06d}.parquet")
+        table = pa.Table.from_pylist(rows, schema=schema)
+        _write_atomic(path, lambda tmp: pq.write_table(table, tmp, compression="zstd"))
+
+    # Chỉ lưu watermark sau khi mọi file đã ghi xong; lỗi giữa chừng → chạy lại ghi đè cùng run
+    new_watermark = {"run": run, "last_id": str(upper_id),
+                     "last_approved_at": upper_at.isoformat(),
+                     "exported_at": datetime.utcnow().isoformat(timespec="seconds")}
+    _write_atomic(os.path.join(leaves_dir, WATERMARK_FILE),
+                  lambda tmp: _dump_json(new_watermark, tmp))
+    if full:
+        _swap_dir(leaves_dir, live_dir)
+    legacy = os.path.join(export_dir, WATERMARK_FILE)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+    return {"run": run, "rows": sum(len(r) for r in partitions.values()),
+            "partitions": len(partitions)}
+
+
+def export_employees(export_dir=EXPORT_DIR):
+    """Ảnh chụp toàn bộ employees (bỏ field nội bộ bắt đầu bằng "_", trừ _id)"""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = pd.DataFrame(list(EMPLOYEES_COL.find({})))
+    if df.empty:
+        return {"rows": 0}
+    df = df[[c for c in df.columns if c == "_id" or not c.startswith("_")]]
+    df["_id"] = df["_id"].astype(str)
+    for col in df.columns:
+        if df[col].dtype == object and col != "_id":
+            # Cột sửa tay qua Sheets có thể lẫn kiểu → số thì giữ, còn lại về chuỗi
+            numeric = pd.to_numeric(df[col], errors="coerce")
+            if numeric.notna().sum() == df[col].notna().sum():
+                df[col] = numeric
+            else:
+                df[col] = df[col].map(lambda v: None if v is None or v != v else str(v))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    _write_atomic(os.path.join(export_dir, "employees", "snapshot.parquet"),
+                  lambda tmp: pq.write_table(table, tmp, compression="zstd"))
+    return {"rows": len(df)}
+
+
+def snapshot_info(export_dir=EXPORT_DIR):
+    """Watermark của lần xuất gần nhất (có exported_at, giờ UTC), None nếu chưa xuất lần nào"""
+    if not os.path.exists(_watermark_path(export_dir)):
+        return None
+    return _read_watermark(export_dir)
+
+
+def read_leaves_snapshot(columns=None, export_dir=EXPORT_DIR):
+    """
+    Đọc toàn bộ yêu cầu nghỉ từ Parquet (memory map, không qua MongoDB)
+    - Mỗi _id chỉ giữ bản ghi của lần xuất mới nhất
+    - None nếu chưa xuất lần nào
+    """
+    import pyarrow.parquet as pq
+
+    leaves_dir = os.path.join(export_dir, "leaves")
+    if not os.path.isdir(leaves_dir):
+        return None
+    if columns is not None:
+        columns = list(dict.fromkeys(["_id", "_run", *columns]))
+    try:
+        table = pq.read_table(leaves_dir, columns=columns, memory_map=True,
+                              partitioning="hive")
+    except FileNotFoundError:  # --full vừa đổi thư mục giữa lúc liệt kê và đọc file → đọc lại
+        table = pq.read_table(leaves_dir, columns=columns, memory_map=True,
+                              partitioning="hive")
+    df = table.to_pandas()
+    return (df.sort_values("_run", kind="stable")
+            .drop_duplicates("_id", keep="last")
+            .reset_index(drop=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất leaves / employees ra Parquet")
+    parser.add_argument("--dir", default=EXPORT_DIR, help="Thư mục xuất")
+    parser.add_argument("--full", action="store_true",
+                        help="Xuất lại từ đầu, xong mới thay dữ liệu đã xuất")
+    args = parser.parse_args(argv)
+
+    leaves = export_leaves(args.dir, full=args.full)
+    employees = export_employees(args.dir)
+    print(f"✅ leaves: lần {leaves['run']}, {leaves['rows']} dòng, {leaves['partitions']} phân vùng")
+    print(f"✅ employees: {employees['rows']} dòng")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# rate_limit.py
+"""
+Giới hạn tần suất dùng chung cho mọi session trong process (token bucket)
+- Mỗi khóa (vd. ("employee", tên nhân viên), ("client", IP)) có một bucket: tối đa `capacity` lượt,
+  hồi lại `refill_per_second` lượt mỗi giây → cho phép bấm dồn ít lần, chặn spam / script
+- Kiểm tra O(1): một lần tra dict + di chuyển khóa về cuối OrderedDict
+- Bucket không dùng quá `idle_seconds` (hoặc vượt `max_keys`) bị xóa từ đầu OrderedDict (LRU)
+- refund(): trả lại lượt cho lần không đáng tính (đăng nhập đúng, gửi trùng / ghi lỗi)
+  → chỉ các lần sai mới làm đầy giới hạn
+- Đăng nhập: giới hạn chặt theo (tài khoản, client) → người khác dò mật khẩu không khóa được
+  chủ tài khoản ở máy họ; giới hạn theo tài khoản rộng hơn để chặn dò từ nhiều IP
+- Đếm số lượt bị chặn theo loại để theo dõi
+- client_id() chỉ tin X-Forwarded-For khi kết nối đến từ proxy trong TRUSTED_PROXIES
+
+Biến môi trường: SUBMIT_RATE ("3/60": 3 lần mỗi 60 giây / nhân viên), SUBMIT_CLIENT_RATE ("30/60"),
+  LOGIN_RATE ("5/300" / tài khoản + client), LOGIN_ACCOUNT_RATE ("50/300" / tài khoản),
+  LOGIN_CLIENT_RATE ("20/300"), RATE_LIMIT_MAX_KEYS (10000),
+  TRUSTED_PROXIES (IP / CIDR cách nhau bởi dấu phẩy, rỗng → bỏ qua X-Forwarded-For)
+"""
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict, Counter
+
+import streamlit as st
+
+
+def _parse_rate(value):
+    """'3/60' → (capacity 3, hồi 3/60 lượt mỗi giây)"""
+    count, seconds = value.split("/")
+    return int(count), int(count) / float(seconds)
+
+
+# Loại khóa → giới hạn; client (IP) rộng hơn vì cả văn phòng có thể dùng chung một IP
+SUBMIT_RATES = {
+    "employee": _parse_rate(os.environ.get("SUBMIT_RATE", "3/60")),
+    "client": _parse_rate(os.environ.get("SUBMIT_CLIENT_RATE", "30/60")),
+}
+LOGIN_RATES = {
+    "user_client": _parse_rate(os.environ.get("LOGIN_RATE", "5/300")),
+    "username": _parse_rate(os.environ.get("LOGIN_ACCOUNT_RATE", "50/300")),
+    "client": _parse_rate(os.environ.get("LOGIN_CLIENT_RATE", "20/300")),
+}
+MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 10000))
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False)
+                   for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+
+class TokenBucketLimiter:
+    """Khóa là tuple (loại, giá trị), mỗi loại có capacity / tốc độ hồi riêng"""
+
+    def __init__(self, rates, max_keys=MAX_KEYS):
+        self.rates = rates
+        self.max_keys = max_keys
+        # Sau thời gian này mọi bucket đã hồi đầy → xóa cũng không đổi kết quả
+        self.idle_seconds = max(capacity / refill for capacity, refill in rates.values())
+        self.allowed = 0
+        self.rejected = Counter()  # loại khóa → số lượt bị chặn
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # khóa → (số lượt còn lại, thời điểm cập nhật)
+
+    def _evict(self, now):
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - updated < self.idle_seconds:
+                break
+            del self._buckets[key]
+
+    def _tokens(self, key, now):
+        """Số lượt hiện có của key (đã hồi theo thời gian), lấy khóa ra khỏi OrderedDict"""
+        capacity, refill = self.rates[key[0]]
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        return min(capacity, tokens + (now - updated) * refill)
+
+    def check(self, *keys, cost=1.0):
+        """
+        Mọi khóa đều phải còn lượt (vd. theo nhân viên và theo client) thì mới trừ
+        - Trả về (True, 0) nếu được phép, (False, số giây cần chờ) nếu bị chặn
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = {key: self._tokens(key, now) for key in keys}
+            short = {key: t for key, t in tokens.items() if t < cost}
+            for key, t in tokens.items():
+                # Gắn lại vào cuối → thứ tự OrderedDict luôn là thứ tự dùng gần nhất
+                self._buckets[key] = (t if short else t - cost, now)
+            if short:
+                for key in short:
+                    self.rejected[key[0]] += 1
+            else:
+                self.allowed += 1
+            self._evict(now)
+        if short:
+            return False, max((cost - t) / self.rates[key[0]][1] for key, t in short.items())
+        return True, 0.0
+
+    def refund(self, *keys, cost=1.0):
+        """Trả lại lượt đã trừ ở check() (không vượt capacity)"""
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                if key in self._buckets:
+                    capacity = self.rates[key[0]][0]
+                    self._buckets[key] = (min(capacity, self._tokens(key, now) + cost), now)
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed,
+                    "rejected": dict(self.rejected)}
+
+
+@st.cache_resource(show_spinner=False)
+def get_submit_limiter():
+    """Giới hạn gửi yêu cầu nghỉ, dùng chung cho cả process"""
+    return TokenBucketLimiter(SUBMIT_RATES)
+
+
+@st.cache_resource(show_spinner=False)
+def get_login_limiter():
+    """Giới hạn đăng nhập HR, dùng chung cho cả process"""
+    return TokenBucketLimiter(LOGIN_RATES)
+
+
+def _trusted(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_id():
+    """
+    Định danh client: IP kết nối, không có thì session
+    - Kết nối đến từ proxy tin cậy → đọc X-Forwarded-For từ phải sang, lấy địa chỉ đầu tiên
+      không phải proxy tin cậy (phần bên trái do client tự ghi, giả được)
+    """
+    ip = getattr(st.context, "ip_address", None)
+    if ip and _trusted(ip):
+        forwarded = (st.context.headers or {}).get("X-Forwarded-For", "")
+        for hop in reversed([h.strip() for h in forwarded.split(",") if h.strip()]):
+            if not _trusted(hop):
+                return hop
+    if ip:
+        return ip
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "unknown"
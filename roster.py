@@ -0,0 +1,75 @@
+# roster.py
+"""
+Cache danh sách nhân viên dùng chung cho mọi session trong process
+- Hết hạn sau TTL giây, hoặc bị xóa chủ động khi dữ liệu nhân viên thay đổi
+- Tra cứu theo (full_name, department) bằng dict thay vì quét list
+"""
+import threading
+import time
+
+import streamlit as st
+
+from settings import EMPLOYEES_COL
+
+ROSTER_TTL_SECONDS = 300
+
+
+class RosterCache:
+    def __init__(self, ttl=ROSTER_TTL_SECONDS):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._employees = None
+        self._by_key = {}
+        self._by_name = {}
+        self._loaded_at = 0.0
+
+    def _load(self):
+        employees = list(EMPLOYEES_COL.find({}, {"_id": 0}))
+        by_key, by_name = {}, {}
+        for emp in employees:
+            name = emp.get("full_name")
+            by_key[(name, emp.get("department"))] = emp
+            by_name.setdefault(name, emp)  # trùng tên → giữ người đầu tiên như next(...)
+        self._employees = employees
+        self._by_key, self._by_name = by_key, by_name
+        self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._employees is None or time.monotonic() - self._loaded_at > self.ttl:
+                self.misses += 1
+                self._load()
+            else:
+                self.hits += 1
+
+    def all(self):
+        """Toàn bộ nhân viên (list dict, không có _id)"""
+        self._ensure_fresh()
+        return self._employees
+
+    def get(self, full_name, department=None):
+        """Tìm nhân viên theo tên (+ phòng ban nếu có)"""
+        self._ensure_fresh()
+        if department is not None:
+            return self._by_key.get((full_name, department))
+        return self._by_name.get(full_name)
+
+    def invalidate(self):
+        """Xóa cache, lần đọc sau sẽ load lại từ MongoDB"""
+        with self._lock:
+            self._employees = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource(show_spinner=False)
+def get_roster():
+    """RosterCache dùng chung cho cả process"""
+    return RosterCache()
+
+
+def invalidate_roster():
+    get_roster().invalidate()
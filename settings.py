@@ -1,20 +1,90 @@
 # settings.py
-import uuid
-import streamlit as st
-from pymongo import MongoClient
-from streamlit_cookies_manager import EncryptedCookieManager
 import os
+import threading
+import streamlit as st
+from instrumentation import instrument_database
 
 # --- MongoDB Config ---
-MONGO_URL = st.secrets["MONGO_URL"]
-DB_NAME = "leave_management"
-client = MongoClient(MONGO_URL)
-db = client[DB_NAME]
+DB_NAME = os.environ.get("MONGO_DB_NAME", "leave_management")
+
+# Client MongoDB được tạo lần đầu khi cần (không phải lúc import)
+# → header/sidebar hiển thị ngay, không chờ kết nối / chọn server; bản thân module pymongo vẫn
+#   được import sớm (functions, indexes, submission_queue, ... dùng InsertOne / lớp lỗi của pymongo)
+# Client, pool, timeout: xem mongo_client.py
+_dbs = {}
+_db_lock = threading.Lock()
+
+
+def get_mongo_url():
+    # Biến môi trường được ưu tiên (CLI, benchmark), mặc định đọc từ st.secrets
+    return os.environ.get("MONGO_URL") or st.secrets["MONGO_URL"]
+
+
+def get_db(analytics=False):
+    """
+    Database dùng chung, tạo client ở lần gọi đầu tiên
+    - analytics=True: client/read preference dành cho dashboard, thống kê, export (chỉ đọc)
+    """
+    key = "analytics" if analytics else "primary"
+    if key not in _dbs:
+        with _db_lock:
+            if key not in _dbs:
+                import mongo_client
+                if analytics:
+                    client = mongo_client.get_analytics_client(get_mongo_url())
+                    database = client.get_database(
+                        DB_NAME, read_preference=mongo_client.analytics_read_preference())
+                else:
+                    database = mongo_client.get_client(get_mongo_url())[DB_NAME]
+                _dbs[key] = instrument_database(database)  # đo thời gian mọi lệnh DB
+    return _dbs[key]
+
+
+class _LazyDatabase:
+    """db[name] / db.xxx → chuyển tiếp tới get_db()"""
+
+    def __init__(self, analytics=False):
+        self._analytics = analytics
+
+    def __getitem__(self, name):
+        return get_db(self._analytics)[name]
+
+    def __getattr__(self, name):
+        return getattr(get_db(self._analytics), name)
+
+
+class _LazyCollection:
+    """Collection chỉ được resolve khi dùng lần đầu"""
+
+    def __init__(self, name, analytics=False):
+        self.name = name
+        self._analytics = analytics
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = get_db(self._analytics)[self.name]
+        return getattr(self._collection, attr)
+
+
+db = _LazyDatabase()
+analytics_db = _LazyDatabase(analytics=True)  # chỉ đọc, có thể đọc từ secondary
 
 # --- Collections ---
-USERS_COL = db["admin"]
-LEAVES_COL = db["leaves"]
-EMPLOYEES_COL = db["employees"]
+USERS_COL = _LazyCollection("admin")
+LEAVES_COL = _LazyCollection("leaves")
+EMPLOYEES_COL = _LazyCollection("employees")
+META_COL = _LazyCollection("_meta")  # phiên bản dữ liệu của từng collection
+LEAVE_SUMMARY_COL = _LazyCollection("leave_summary")  # tổng hợp tháng × phòng ban × loại × trạng thái
+HOLIDAYS_COL = _LazyCollection("holidays")  # ngày lễ bổ sung, HR sửa qua tab Sheets
+BALANCE_LEDGER_COL = _LazyCollection("balance_ledger")  # sổ trừ phép, mỗi yêu cầu đã duyệt một dòng
+
+# Bản chỉ đọc cho dashboard / thống kê
+ANALYTICS_LEAVES_COL = _LazyCollection("leaves", analytics=True)
+ANALYTICS_LEAVE_SUMMARY_COL = _LazyCollection("leave_summary", analytics=True)
+
+# Collection nội bộ, không hiển thị trong tab Sheets
+INTERNAL_COLLECTIONS = {"admin", "_meta", "leave_summary", "balance_ledger"}
 
 # --- Constants ---
 STATUS_COLORS = {
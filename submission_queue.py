@@ -0,0 +1,338 @@
+# submission_queue.py
+"""
+Hàng đợi ghi yêu cầu nghỉ (write-behind)
+- submit(): kiểm tra trùng bằng idempotency_key, ghi yêu cầu ra file spool rồi đưa vào hàng đợi
+- Luồng nền ghi ngay khi hàng đợi rảnh; yêu cầu dồn lại trong lúc đang ghi được gom thành một
+  lô insert_many ở lần ghi sau (không chờ cố định), thử lại khi mất kết nối
+- Kết quả từng khóa ("written" / "duplicate" / "failed") giữ trong bộ nhớ: UI chờ bằng wait()
+  hoặc hỏi lại bằng status() ở các lần rerun sau
+- Chống gửi trùng (bấm 2 lần, F5, nhiều tab): cùng nội dung → cùng idempotency_key,
+  unique index trên idempotency_key của các yêu cầu pending (xem indexes.py) chặn ở tầng DB
+- Spool (mỗi yêu cầu một file BSON, xóa khi đã ghi xong): process chết / restart khi hàng đợi
+  còn yêu cầu → process khởi động sau ghi lại các file cũ hơn SUBMIT_SPOOL_GRACE_SECONDS;
+  _id gán trước khi spool nên ghi lại không tạo bản sao
+
+Biến môi trường: SUBMIT_BATCH_SIZE (200), SUBMIT_FLUSH_MS (0), SUBMIT_MAX_RETRIES (5),
+SUBMIT_WAIT_MS (2000),
+SUBMIT_SPOOL_DIR (thư mục tạm của hệ thống / leave_submissions, rỗng → tắt spool),
+SUBMIT_SPOOL_GRACE_SECONDS (60)
+"""
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+import streamlit as st
+from bson import ObjectId
+from bson.errors import BSONError
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure
+
+from settings import LEAVES_COL, LEAVE_SUMMARY_COL
+from leave_summary import add_leave_ops
+from leave_intervals import get_interval_index
+from versioning import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("SUBMIT_BATCH_SIZE", 200))
+FLUSH_SECONDS = int(os.environ.get("SUBMIT_FLUSH_MS", 0)) / 1000  # chờ gom lô, 0 = không chờ
+MAX_RETRIES = int(os.environ.get("SUBMIT_MAX_RETRIES", 5))
+SPOOL_DIR = os.environ.get(
+    "SUBMIT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "leave_submissions")) or None
+SPOOL_GRACE = int(os.environ.get("SUBMIT_SPOOL_GRACE_SECONDS", 60))
+WAIT_SECONDS = int(os.environ.get("SUBMIT_WAIT_MS", 2000)) / 1000  # UI chờ kết quả ghi tối đa
+MAX_RESULTS = 10000  # số kết quả gần nhất giữ lại cho status()
+DUPLICATE_KEY = 11000
+IDEMPOTENCY_FIELD = "idempotency_key"
+WRITTEN, DUPLICATE, FAILED, QUEUED = "written", "duplicate", "failed", "queued"
+
+
+def _is_id_duplicate(error):
+    """Trùng _id = lần thử trước đã ghi được (khác với trùng idempotency_key)"""
+    key_pattern = error.get("keyPattern")
+    if key_pattern is not None:
+        return list(key_pattern) == ["_id"]
+    return "_id_ dup key" in error.get("errmsg", "")
+
+
+def make_idempotency_key(full_name, start_date, end_date, leave_type, leave_case):
+    """Khóa chống gửi trùng: cùng người, cùng khoảng ngày, cùng loại nghỉ → cùng khóa"""
+    raw = "|".join(str(v) for v in (full_name, start_date, end_date, leave_type, leave_case))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SubmissionQueue:
+    def __init__(self, collection=LEAVES_COL, intervals=None, batch_size=BATCH_SIZE,
+                 flush_seconds=FLUSH_SECONDS, max_retries=MAX_RETRIES, spool_dir=SPOOL_DIR):
+        self.collection = collection
+        self.intervals = intervals  # LeaveIntervalIndex cần cập nhật sau khi ghi (nếu có)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.spool_dir = spool_dir
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        self.counters = {"submitted": 0, "duplicates": 0, "written": 0,
+                         "batches": 0, "retries": 0, "failed": 0, "recovered": 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued_keys = set()  # khóa đang nằm trong hàng đợi, chưa ghi xuống DB
+        self._results = OrderedDict()  # khóa → kết quả ghi, chỉ giữ MAX_RESULTS khóa gần nhất
+        self._idle = threading.Condition(self._lock)
+        threading.Thread(target=self._run, name="leave-submission-writer", daemon=True).start()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    # --- Phía UI ---
+    def submit(self, leave):
+        """
+        Đưa yêu cầu vào hàng đợi
+        - leave phải có idempotency_key; _id được gán ngay để các bước sau dùng được
+        - Trả về "queued" hoặc "duplicate"; kết quả ghi xem bằng wait() / status()
+        """
+        key = leave[IDEMPOTENCY_FIELD]
+        # Đã ghi từ trước (session khác / process khác): một lần đọc theo index
+        if self.collection.find_one({IDEMPOTENCY_FIELD: key, "status": "pending"}, {"_id": 1}):
+            self._count("duplicates")
+            return DUPLICATE
+        with self._lock:
+            if key in self._queued_keys:
+                self.counters["duplicates"] += 1
+                return DUPLICATE
+            self._queued_keys.add(key)
+            self._results.pop(key, None)
+            self.counters["submitted"] += 1
+        leave.setdefault("_id", ObjectId())
+        try:
+            self._spool(leave)
+        except OSError:
+            with self._idle:
+                self._queued_keys.discard(key)
+                self._idle.notify_all()
+            raise
+        self._queue.put(leave)
+        return QUEUED
+
+    def status(self, key):
+        """Kết quả của khóa: "queued" / "written" / "duplicate" / "failed", None nếu không biết khóa"""
+        with self._lock:
+            if key in self._queued_keys:
+                return QUEUED
+            return self._results.get(key)
+
+    def wait(self, key, timeout):
+        """Chờ tối đa timeout giây cho tới khi khóa được ghi xong, trả về status(key)"""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while key in self._queued_keys:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return QUEUED
+                self._idle.wait(remaining)
+            return self._results.get(key)
+
+    def flush(self, timeout=None):
+        """Chờ tới khi hàng đợi đã ghi hết (benchmark / tắt process)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._queued_keys:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "queued": len(self._queued_keys)}
+
+    # --- Spool ---
+    def _spool_path(self, leave):
+        return os.path.join(self.spool_dir, f"{leave['_id']}.bson")
+
+    def _spool(self, leave):
+        """Ghi yêu cầu ra file (fsync) trước khi vào hàng đợi"""
+        if not self.spool_dir:
+            return
+        path = self._spool_path(leave)
+        tmp = os.path.join(self.spool_dir, f".{leave['_id']}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(bson.encode(leave))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _unspool(self, leave):
+        if not self.spool_dir:
+            return
+        try:
+            os.remove(self._spool_path(leave))
+        except FileNotFoundError:
+            pass
+
+    def recover(self, grace=SPOOL_GRACE):
+        """
+        Đưa lại vào hàng đợi các yêu cầu process trước chưa kịp ghi (file spool cũ hơn grace giây)
+        - File mới hơn có thể thuộc một process khác vẫn đang chạy → để nó tự ghi
+        - Đổi tên file để nhận: nhiều process khởi động cùng lúc chỉ một process ghi lại
+        - Trả về số yêu cầu được đưa lại vào hàng đợi
+        """
+        if not self.spool_dir:
+            return 0
+        cutoff = time.time() - grace
+        recovered = []
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if not name.endswith(".bson"):
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                claimed = os.path.join(self.spool_dir, f".{name}.{os.getpid()}.claim")
+                os.rename(path, claimed)
+            except FileNotFoundError:  # process khác vừa nhận / vừa ghi xong
+                continue
+            try:
+                with open(claimed, "rb") as f:
+                    recovered.append(bson.decode(f.read()))
+                self._spool(recovered[-1])  # file mới, mtime mới
+                os.remove(claimed)
+            except (OSError, BSONError) as e:
+                logger.error("Không đọc được file spool %s: %s", claimed, e)
+        if not recovered:
+            return 0
+        # Ghi được rồi nhưng process chết trước khi xóa file → chỉ xóa file
+        written = {d["_id"] for d in self.collection.find(
+            {"_id": {"$in": [leave["_id"] for leave in recovered]}}, {"_id": 1})}
+        pending = []
+        for leave in recovered:
+            if leave["_id"] in written:
+                self._unspool(leave)
+            else:
+                pending.append(leave)
+        with self._lock:
+            for leave in pending:
+                self._queued_keys.add(leave[IDEMPOTENCY_FIELD])
+            self.counters["recovered"] += len(pending)
+        for leave in pending:
+            self._queue.put(leave)
+        if pending:
+            logger.warning("Ghi lại %s yêu cầu nghỉ còn trong spool", len(pending))
+        return len(pending)
+
+    # --- Luồng nền ---
+    def _next_batch(self):
+        """
+        Lô kế tiếp: lấy ngay mọi yêu cầu đã có trong hàng đợi (dồn lại trong lúc ghi lô trước),
+        không chờ thêm → hàng đợi rảnh thì ghi ngay; flush_seconds > 0 thì chờ gom thêm
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, batch):
+        """
+        insert_many có thử lại; trả về {khóa: kết quả} cho cả lô
+        - Trùng _id: lần thử trước đã ghi nhưng mất kết nối trước khi nhận phản hồi → "written"
+        - Trùng idempotency_key: tab / process khác đã gửi cùng yêu cầu → "duplicate"
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                return {leave[IDEMPOTENCY_FIELD]: WRITTEN for leave in batch}
+            except BulkWriteError as e:
+                outcome = {leave[IDEMPOTENCY_FIELD]: WRITTEN for leave in batch}
+                errors = e.details.get("writeErrors", [])
+                others = []
+                for err in errors:
+                    key = batch[err["index"]][IDEMPOTENCY_FIELD]
+                    if err.get("code") != DUPLICATE_KEY:
+                        outcome[key] = FAILED
+                        others.append(err)
+                    elif not _is_id_duplicate(err):
+                        outcome[key] = DUPLICATE
+                if others:
+                    logger.error("Không ghi được %s yêu cầu nghỉ: %s", len(others), others[0])
+                    self._count("failed", len(others))
+                self._count("duplicates", sum(1 for v in outcome.values() if v == DUPLICATE))
+                return outcome
+            except (AutoReconnect, ConnectionFailure) as e:
+                if attempt == self.max_retries:
+                    # File spool được giữ lại → lần khởi động sau (recover) ghi tiếp
+                    logger.error("Chưa ghi được %s yêu cầu nghỉ sau %s lần thử: %s",
+                                 len(batch), attempt + 1, e)
+                    self._count("failed", len(batch))
+                    return {leave[IDEMPOTENCY_FIELD]: FAILED for leave in batch}
+                self._count("retries")
+                time.sleep(min(0.1 * 2 ** attempt, 5))  # _id cố định → thử lại không tạo bản sao
+
+    def _after_insert(self, written):
+        """Cập nhật bảng tổng hợp, chỉ mục khoảng ngày, version: một lần cho cả lô"""
+        if not written:
+            return
+        LEAVE_SUMMARY_COL.bulk_write(
+            [op for leave in written for op in add_leave_ops(leave)], ordered=False)
+        if self.intervals is not None:
+            for leave in written:
+                self.intervals.add(leave)
+        bump_data_version("leaves")
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            outcome = {}
+            try:
+                outcome = self._insert(batch)
+                written = [leave for leave in batch
+                           if outcome[leave[IDEMPOTENCY_FIELD]] == WRITTEN]
+                for leave in batch:
+                    if outcome[leave[IDEMPOTENCY_FIELD]] != FAILED:
+                        self._unspool(leave)
+                self._after_insert(written)
+                self._count("written", len(written))
+                self._count("batches")
+            except Exception:  # luồng nền không được chết
+                logger.exception("Lỗi khi ghi lô yêu cầu nghỉ")
+                if not outcome:
+                    self._count("failed", len(batch))
+            finally:
+                with self._idle:
+                    for leave in batch:
+                        key = leave[IDEMPOTENCY_FIELD]
+                        self._queued_keys.discard(key)
+                        self._results[key] = outcome.get(key, FAILED)
+                        self._results.move_to_end(key)
+                    while len(self._results) > MAX_RESULTS:
+                        self._results.popitem(last=False)
+                    self._idle.notify_all()
+
+
+@st.cache_resource(show_spinner=False)
+def get_submission_queue():
+    """Một hàng đợi + một luồng ghi cho cả process"""
+    # Lấy sẵn chỉ mục khoảng ngày ở luồng của Streamlit, luồng nền chỉ dùng lại
+    submissions = SubmissionQueue(intervals=get_interval_index())
+    submissions.recover()
+    atexit.register(submissions.flush, 10)
+    return submissions
@@ -0,0 +1,33 @@
+# versioning.py
+"""
+Phiên bản dữ liệu theo collection
+- Mỗi lần app ghi vào một collection thì tăng version
+- Dùng làm khóa cache (export Excel, dashboard, ...) để không tính lại khi dữ liệu không đổi
+- VERSION_FIELD: phiên bản của từng document, đổi mỗi khi app ghi document đó
+  → tab Sheets dùng để phát hiện hai người sửa cùng một dòng
+"""
+import uuid
+
+from settings import META_COL, db
+
+VERSION_FIELD = "_version"
+
+
+def new_version():
+    """Giá trị _version mới (chuỗi ngẫu nhiên, không cần đọc giá trị cũ)"""
+    return uuid.uuid4().hex
+
+
+def bump_data_version(col_name):
+    """Tăng version của collection sau khi ghi"""
+    META_COL.update_one({"_id": col_name}, {
+                        "$inc": {"version": 1}}, upsert=True)
+
+
+def get_data_version(col_name):
+    """
+    Version hiện tại của collection
+    - Kèm estimated_document_count để bắt cả thay đổi ngoài app (thêm/xóa trực tiếp trên DB)
+    """
+    doc = META_COL.find_one({"_id": col_name}) or {}
+    return doc.get("version", 0), db[col_name].estimated_document_count()
@@ -0,0 +1,177 @@
+# workdays.py
+"""
+Tính số ngày làm việc của yêu cầu nghỉ (bỏ cuối tuần và ngày lễ)
+- Dựa trên numpy.busday_count / busday_offset → tính cả mảng trong một lần
+- Ngày lễ = collection "holidays" (HR thêm/sửa/xóa qua tab Sheets, mỗi document có field "date");
+  lần đầu chạy ensure_holidays() chép bảng mặc định (lễ Việt Nam theo lịch nghỉ chính thức) vào
+- Năm chưa có ngày lễ nào (vd. bảng mặc định chưa có năm mới) → years_without_holidays() để cảnh báo
+- duration hợp lệ khi làm tròn lên bằng đúng số ngày làm việc (cho phép nửa ngày ở ngày cuối)
+Chạy từ CLI:  python workdays.py [--all-statuses]  (kiểm tra toàn bộ leaves, exit 1 nếu có sai lệch)
+
+Biến môi trường: WORKWEEK_MASK ("1111100": thứ 2 → thứ 6)
+"""
+import argparse
+import logging
+import math
+import os
+import sys
+from datetime import datetime
+
+import streamlit as st
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from settings import ANALYTICS_LEAVES_COL, HOLIDAYS_COL
+
+logger = logging.getLogger(__name__)
+
+WEEKMASK = os.environ.get("WORKWEEK_MASK", "1111100")
+
+# Lịch nghỉ lễ, Tết theo thông báo của Bộ LĐ-TB&XH (gồm cả ngày nghỉ bù)
+DEFAULT_HOLIDAYS = {
+    2024: ["2024-01-01", "2024-02-08", "2024-02-09", "2024-02-12", "2024-02-13",
+           "2024-02-14", "2024-04-18", "2024-04-29", "2024-04-30", "2024-05-01",
+           "2024-09-02", "2024-09-03"],
+    2025: ["2025-01-01", "2025-01-27", "2025-01-28", "2025-01-29", "2025-01-30",
+           "2025-01-31", "2025-04-07", "2025-04-30", "2025-05-01", "2025-05-02",
+           "2025-09-01", "2025-09-02"],
+    2026: ["2026-01-01", "2026-01-02", "2026-02-16", "2026-02-17", "2026-02-18",
+           "2026-02-19", "2026-02-20", "2026-04-27", "2026-04-30", "2026-05-01",
+           "2026-09-01", "2026-09-02"],
+}
+
+
+def ensure_holidays():
+    """
+    Collection holidays rỗng → chép bảng mặc định vào (indexes.bootstrap_indexes gọi ở luồng nền)
+    - Upsert theo date: nhiều process khởi động cùng lúc không tạo dòng trùng
+    - Trả về số ngày lễ được thêm
+    """
+    try:
+        if HOLIDAYS_COL.estimated_document_count():
+            return 0
+        result = HOLIDAYS_COL.bulk_write([UpdateOne(
+            {"date": datetime.strptime(day, "%Y-%m-%d")},
+            {"$setOnInsert": {"note": "Lịch nghỉ chính thức"}}, upsert=True)
+            for year in DEFAULT_HOLIDAYS.values() for day in year], ordered=False)
+    except PyMongoError as e:  # không có quyền ghi → load_holidays vẫn dùng bảng mặc định
+        logger.warning("Không thể tạo bảng ngày lễ: %s", e)
+        return 0
+    load_holidays.clear()
+    return result.upserted_count
+
+
+@st.cache_data(show_spinner=False, ttl=300)
+def load_holidays():
+    """Mảng datetime64[D] các ngày lễ (collection holidays, rỗng thì bảng mặc định), đã sắp xếp"""
+    import numpy as np
+    from leave_dates import to_datetime
+
+    days = set()
+    for doc in HOLIDAYS_COL.find({}, {"_id": 0, "date": 1}):
+        value = to_datetime(doc.get("date"))
+        if value:
+            days.add(value.strftime("%Y-%m-%d"))
+    if not days:
+        days = {d for year in DEFAULT_HOLIDAYS.values() for d in year}
+    return np.array(sorted(days), dtype="datetime64[D]")
+
+
+def years_without_holidays(start_date, end_date, holidays=None):
+    """Các năm trong [start_date, end_date] chưa có ngày lễ nào → số ngày làm việc có thể sai"""
+    holidays = load_holidays() if holidays is None else holidays
+    known = {int(str(day)[:4]) for day in holidays}
+    return [year for year in range(start_date.year, end_date.year + 1) if year not in known]
+
+
+def _day(value):
+    """date / datetime / chuỗi → numpy datetime64[D]"""
+    import numpy as np
+    if isinstance(value, datetime):
+        value = value.date()
+    return np.datetime64(value, "D")
+
+
+def working_days(start_date, end_date, holidays=None):
+    """Số ngày làm việc trong [start_date, end_date] (tính cả hai đầu)"""
+    import numpy as np
+    holidays = load_holidays() if holidays is None else holidays
+    return int(np.busday_count(_day(start_date), _day(end_date) + 1,
+                               weekmask=WEEKMASK, holidays=holidays))
+
+
+def end_date_for(start_date, duration, holidays=None):
+    """Ngày kết thúc để nghỉ đủ `duration` ngày làm việc tính từ start_date"""
+    import numpy as np
+    holidays = load_holidays() if holidays is None else holidays
+    first = np.busday_offset(_day(start_date), 0, roll="forward",
+                             weekmask=WEEKMASK, holidays=holidays)
+    end = np.busday_offset(first, max(math.ceil(duration) - 1, 0),
+                           weekmask=WEEKMASK, holidays=holidays)
+    return end.astype(object)
+
+
+def validate_duration(start_date, end_date, duration, holidays=None):
+    """
+    Kiểm tra duration khớp với khoảng ngày
+    - Trả về (True, số ngày làm việc) hoặc (False, thông báo lỗi)
+    """
+    if end_date < start_date:
+        return False, "Ngày kết thúc phải sau ngày bắt đầu."
+    days = working_days(start_date, end_date, holidays)
+    if days == 0:
+        return False, "Khoảng ngày đã chọn không có ngày làm việc nào (cuối tuần / ngày lễ)."
+    if not days - 1 < float(duration) <= days:
+        return False, (f"Số ngày nghỉ ({duration}) không khớp với {days} ngày làm việc "
+                       f"từ {start_date:%d/%m/%Y} đến {end_date:%d/%m/%Y}.")
+    return True, days
+
+
+def audit_leave_durations(statuses=("pending", "approved")):
+    """
+    Kiểm tra toàn bộ LEAVES_COL trong một lượt (vector hóa, không lặp từng dòng)
+    - Trả về DataFrame các yêu cầu có duration không khớp số ngày làm việc
+    """
+    import numpy as np
+    import pandas as pd
+
+    query = {"status": {"$in": list(statuses)}} if statuses else {}
+    columns = ["_id", "full_name", "department", "leave_type",
+               "start_date", "end_date", "duration", "status"]
+    df = pd.DataFrame(list(ANALYTICS_LEAVES_COL.find(query, {c: 1 for c in columns})),
+                      columns=columns)
+    if df.empty:
+        return df.assign(working_days=pd.Series(dtype="int64"))
+
+    start = pd.to_datetime(df["start_date"], errors="coerce").values.astype("datetime64[D]")
+    end = pd.to_datetime(df["end_date"], errors="coerce").values.astype("datetime64[D]")
+    duration = pd.to_numeric(df["duration"], errors="coerce").to_numpy(dtype=float)
+
+    valid = ~(np.isnat(start) | np.isnat(end)) & (end >= start)
+    days = np.zeros(len(df), dtype=np.int64)
+    days[valid] = np.busday_count(start[valid], end[valid] + 1,
+                                  weekmask=WEEKMASK, holidays=load_holidays())
+
+    ok = valid & (duration > days - 1) & (duration <= days)
+    mismatched = df.loc[~ok].assign(working_days=days[~ok])
+    mismatched["_id"] = mismatched["_id"].astype(str)
+    return mismatched.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Kiểm tra số ngày nghỉ so với ngày làm việc")
+    parser.add_argument("--all-statuses", action="store_true",
+                        help="Kiểm tra cả yêu cầu đã bị từ chối")
+    args = parser.parse_args(argv)
+
+    mismatched = audit_leave_durations(None if args.all_statuses else ("pending", "approved"))
+    for row in mismatched.to_dict("records"):
+        print(f"⚠️ {row['_id']} {row['full_name']}: {row['start_date']} → {row['end_date']} "
+              f"ghi {row['duration']} ngày, đúng {row['working_days']} ngày làm việc")
+    print(f"Tổng số yêu cầu sai lệch: {len(mismatched)}")
+    return 1 if len(mismatched) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())